@@ -1,12 +1,18 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 import uuid
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from app.models.models import User, Task, Result, Withdrawal
-from app.schemas.schemas import RegisterRequest, TaskList
+from app.models.models import User, Task, Result
+from app.schemas.schemas import RegisterRequest
+from app.schemas.bulk import validate_tasks
 from app.templates.index import get_html_template
-from app.core.instances import task_manager
+from app.core.pagination import encode_cursor, decode_cursor, keyset_after
+from app.core.serialization import dumps
+from app.services.result_exporter import ResultExporter
+from app.services.task_ingestor import TaskIngestor
+from app.core.instances import task_manager, ledger_manager, dispatcher, broadcaster, cluster, user_cache
 
 router = APIRouter()
 
@@ -42,18 +48,22 @@ async def register(request: RegisterRequest):
 
 @router.get("/user/{client_id}")
 async def get_user_info(client_id: str):
-    user = await User.get_or_none(id=client_id)
+    user = await user_cache.get(client_id)
     if not user:
         raise HTTPException(404, "用户不存在")
     
     return {
-        "username": user.username,
-        "points": user.points,
-        "created_at": user.created_at
+        "username": user["username"],
+        "points": user["points"],
+        "created_at": user["created_at"]
     }
 
 @router.get("/results")
-async def get_results(page: int = 1, per_page: int = 10):
+async def get_results(page: int = 1, per_page: int = 10, cursor: Optional[str] = None):
+    # 传入 cursor 参数(首页传空字符串)时使用游标分页
+    if cursor is not None:
+        return await get_results_by_cursor(cursor, per_page)
+
     # 获取总记录数
     total_count = await Result.all().count()
     
@@ -72,17 +82,131 @@ async def get_results(page: int = 1, per_page: int = 10):
         "has_more": has_more
     }
 
+async def get_results_by_cursor(cursor: str, per_page: int):
+    """按 (created_at, id) 游标分页, 不统计总数"""
+    query = Result.all()
+    if cursor:
+        try:
+            created_at, last_id = decode_cursor(cursor, datetime, int)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        query = query.filter(keyset_after('created_at', created_at, 'id', last_id))
+
+    results = await query.order_by("created_at", "id").limit(per_page + 1).values(
+        "id", "result_data", "created_at",
+        task_id="task__id",
+        task_name="task__name"
+    )
+    has_more = len(results) > per_page
+    results = results[:per_page]
+
+    return {
+        "results": results,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(results[-1]["created_at"], results[-1]["id"]) if has_more else None
+    }
+
 @router.get("/rank")
-async def get_rank(page: int = 1, per_page: int = 10):
+async def get_rank(page: int = 1, per_page: int = 10, cursor: Optional[str] = None):
+    # 传入 cursor 参数(首页传空字符串)时使用游标分页, 否则保持网页使用的列表格式
+    if cursor is not None:
+        return await get_rank_by_cursor(cursor, per_page)
+
     users = await User.all().order_by('-points').offset((page-1)*per_page).limit(per_page).values(
         "username", "points"
     )
     return users
 
+async def get_rank_by_cursor(cursor: str, per_page: int):
+    """按 (points DESC, username) 游标分页, 游标中不包含客户端ID"""
+    query = User.all()
+    if cursor:
+        try:
+            points, username = decode_cursor(cursor, int, str)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        query = query.filter(keyset_after('points', points, 'username', username, descending=True))
+
+    users = await query.order_by('-points', 'username').limit(per_page + 1).values(
+        "username", "points"
+    )
+    has_more = len(users) > per_page
+    users = users[:per_page]
+
+    return {
+        "items": users,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(users[-1]["points"], users[-1]["username"]) if has_more else None
+    }
+
+# /workers/stats 可用的排序字段
+WORKER_STATS_SORT_KEYS = {
+    "ratio", "seconds", "success_rate", "timeout_rate", "fast_rate", "completed", "timeouts", "rejected"
+}
+
+@router.get("/workers/stats")
+async def get_worker_stats(sort: str = "ratio", limit: int = 100, asc: bool = False):
+    """本节点记录的客户端执行统计, 默认按 ratio 从大到小(最慢的在前); 以用户名标识, 不返回客户端ID"""
+    if sort not in WORKER_STATS_SORT_KEYS:
+        raise HTTPException(400, f"sort 必须是 {', '.join(sorted(WORKER_STATS_SORT_KEYS))} 之一")
+    stats = task_manager.stats.snapshot()
+    # 还没有用时记录的客户端排在最后
+    measured = sorted((item for item in stats if item[sort] is not None), key=lambda item: item[sort], reverse=not asc)
+    stats = (measured + [item for item in stats if item[sort] is None])[:max(limit, 0)]
+
+    usernames = dict(await User.filter(id__in=[item["client_id"] for item in stats]).values_list("id", "username"))
+    return [
+        dict(
+            {key: value for key, value in item.items() if key != "client_id"},
+            username=usernames.get(item["client_id"]),
+            online=item["client_id"] in task_manager.clients
+        )
+        for item in stats
+    ]
+
+@router.get("/export/results")
+async def export_results(
+    format: str = 'ndjson',
+    gzip: bool = False,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    task_prefix: Optional[str] = None
+):
+    """流式导出任务结果, 传入最后收到的 cursor 可断点续传"""
+    try:
+        exporter = ResultExporter(format, gzip, cursor, since, until, task_prefix)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    headers = {"Content-Encoding": "gzip"} if gzip else None
+    return StreamingResponse(exporter.stream(), media_type=exporter.media_type, headers=headers)
+
+async def parse_task_list(request: Request) -> List[dict]:
+    """按 TaskList 的规则批量校验请求体, 不为每个任务构造模型对象; 错误格式与 FastAPI 的 422 响应一致"""
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(422, [{"loc": ["body"], "msg": "invalid json", "type": "value_error.jsondecode"}])
+    if not isinstance(payload, dict):
+        raise HTTPException(422, [{"loc": ["body"], "msg": "value is not a valid dict", "type": "type_error.dict"}])
+    if "tasks" not in payload:
+        raise HTTPException(422, [{"loc": ["body", "tasks"], "msg": "field required", "type": "value_error.missing"}])
+    if not isinstance(payload["tasks"], list):
+        raise HTTPException(422, [{"loc": ["body", "tasks"], "msg": "value is not a valid list", "type": "type_error.list"}])
+
+    tasks, errors = validate_tasks(payload["tasks"])
+    if errors:
+        raise HTTPException(422, [
+            {**{k: v for k, v in error.items() if k != "row"}, "loc": ["body", "tasks", error["row"], *error["loc"]]}
+            for error in errors
+        ])
+    return tasks
+
 @router.post("/add_tasks")
-async def add_tasks(task_list: TaskList):
+async def add_tasks(request: Request):
+    task_data = await parse_task_list(request)
     try:
-        task_data = [t.dict() for t in task_list.tasks]
         existing_ids = await Task.filter(id__in=[t['id'] for t in task_data]).values_list('id', flat=True)
         
         unique_tasks = [t for t in task_data if t['id'] not in existing_ids]
@@ -90,23 +214,24 @@ async def add_tasks(task_list: TaskList):
         if not unique_tasks:
             return {"message": "No new tasks added", "duplicates": len(task_data) - len(unique_tasks)}
         
+        for task in unique_tasks:
+            task['requirements'] = Task.requirements_of(task['data'])
         chunk_size = 1000
         for i in range(0, len(unique_tasks), chunk_size):
             await Task.bulk_create(
                 [Task(**task) for task in unique_tasks[i:i+chunk_size]],
                 batch_size=chunk_size
             )
+        groups = {(task['queue'], task['requirements']) for task in unique_tasks}
+        task_manager.counter.tasks_added(len(unique_tasks))
+        dispatcher.tasks_available(groups)
+        cluster.tasks_available(len(unique_tasks), groups)
         
-        # 广播任务数量更新给所有客户端
-        total_tasks = await task_manager.get_pending_tasks_count()
-        for client_id in task_manager.clients:
-            await task_manager.send_to_client(client_id, {
-                "event": "task_count",
-                "data": {"total_tasks": total_tasks}
-            })
-
-        # 尝试分配任务
-        assigned_count = await task_manager.try_assign_tasks()
+        # 广播任务数量更新给所有客户端(合并推送, 不阻塞响应)
+        broadcaster.publish_task_count()
+
+        # 立即为空闲客户端分配任务
+        assigned_count = await dispatcher.dispatch()
         
         return {
             "message": f"Added {len(unique_tasks)} tasks",
@@ -120,20 +245,65 @@ async def add_tasks(task_list: TaskList):
             detail=f"任务创建失败: {str(e)}"
         )
 
+class UploadProgressResponse(StreamingResponse):
+    """边读请求体边输出的流式响应
+
+    StreamingResponse 会同时读取 receive 等待客户端断开, 读到的请求体消息被直接丢弃;
+    请求体还在被读取时不能这样做, 这里只输出响应, 客户端断开时读取请求体会抛出异常而结束。
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@router.post("/add_tasks/stream")
+async def add_tasks_stream(request: Request, format: Optional[str] = None, progress: bool = False):
+    """流式导入任务, 请求体为 NDJSON(默认) 或 CSV, Content-Type 为 text/csv 时按 CSV 解析
+
+    progress=true 时以 NDJSON 流式返回: 每写入一块输出一行该块的进度, 最后一行为汇总(done 为 true)。
+    """
+    if format is None:
+        format = 'csv' if 'csv' in request.headers.get('content-type', '') else 'ndjson'
+    try:
+        ingestor = TaskIngestor(format)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    async def import_chunks():
+        # 每块写入后立即计数并分发, 导入期间客户端就能拿到任务
+        async for chunk in ingestor.iter_chunks(request.stream()):
+            if chunk["inserted"]:
+                task_manager.counter.tasks_added(chunk["inserted"])
+                dispatcher.tasks_available(ingestor.groups)
+                cluster.tasks_available(chunk["inserted"], ingestor.groups)
+                broadcaster.publish_task_count()
+            yield chunk
+
+    if not progress:
+        async for _ in import_chunks():
+            pass
+        return ingestor.summary
+
+    async def progress_lines():
+        async for chunk in import_chunks():
+            yield dumps(chunk) + "\n"
+        summary = {key: value for key, value in ingestor.summary.items() if key != "chunks"}
+        yield dumps(dict(summary, done=True)) + "\n"
+
+    return UploadProgressResponse(progress_lines(), media_type="application/x-ndjson")
+
 @router.post("/withdraw")
 async def create_withdrawal(client_id: str, amount: int):
-    user = await User.get(id=client_id)
-    if user.points < amount:
+    if amount <= 0:
+        return JSONResponse({"error": "Invalid amount"}, status_code=400)
+
+    withdrawal = await ledger_manager.withdraw(client_id, amount)
+    if withdrawal is None:
+        if not await User.exists(id=client_id):
+            raise HTTPException(404, "用户不存在")
         return JSONResponse({"error": "Insufficient points"}, status_code=400)
-    
-    user.points -= amount
-    await user.save()
-    
-    withdrawal = await Withdrawal.create(
-        user=user,
-        amount=amount,
-        status='pending'
-    )
+
+    user_cache.add_points(client_id, -amount)
+    cluster.points_changed(client_id, -amount)
     return {"message": "Withdrawal request created", "id": withdrawal.id}
 
 @router.get("/")
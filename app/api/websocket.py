@@ -4,5 +4,6 @@ from app.services.websocket_service import WebSocketService
 router = APIRouter()
 
 @router.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await WebSocketService.handle_connection(websocket, client_id) 
\ No newline at end of file
+async def websocket_endpoint(websocket: WebSocket, client_id: str, prefetch: int = 1, capabilities: str = '',
+                             protocol: str = 'json', batch: bool = False):
+    await WebSocketService.handle_connection(websocket, client_id, prefetch, capabilities, protocol, batch) 
\ No newline at end of file
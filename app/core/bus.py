@@ -0,0 +1,152 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+class LocalBus:
+    """进程内消息总线, 方法与 Redis 对应命令的语义一致
+
+    单进程部署和测试时使用; 多进程部署需改用 RedisBus, 各进程才能看到同一份数据。
+    """
+
+    # 其他进程看不到这个总线上的心跳和选主结果
+    shared = False
+
+    def __init__(self):
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        # key -> (value, 过期时间)
+        self._keys: Dict[str, Tuple[str, float]] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def publish(self, channel: str, message: str) -> int:
+        queues = self._subscribers.get(channel, [])
+        for queue in queues:
+            queue.put_nowait((channel, message))
+        return len(queues)
+
+    async def subscribe(self, *channels: str) -> AsyncIterator[Tuple[str, str]]:
+        queue: asyncio.Queue = asyncio.Queue()
+        for channel in channels:
+            self._subscribers.setdefault(channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            for channel in channels:
+                self._subscribers[channel].remove(queue)
+
+    async def hset(self, key: str, field: str, value: str):
+        self._hashes.setdefault(key, {})[field] = value
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        return self._hashes.get(key, {}).get(field)
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return dict(self._hashes.get(key, {}))
+
+    async def hdel(self, key: str, *fields: str) -> int:
+        values = self._hashes.get(key, {})
+        return sum(values.pop(field, None) is not None for field in fields)
+
+    async def hdel_if_equal(self, key: str, field: str, value: str) -> bool:
+        """字段值等于 value 时才删除"""
+        values = self._hashes.get(key, {})
+        if values.get(field) != value:
+            return False
+        del values[field]
+        return True
+
+    async def set_nx(self, key: str, value: str, ttl: float) -> bool:
+        """SET key value NX PX ttl"""
+        if self._get(key) is not None:
+            return False
+        self._keys[key] = (value, time.monotonic() + ttl)
+        return True
+
+    async def renew(self, key: str, value: str, ttl: float) -> bool:
+        """值等于 value 时才续期"""
+        if self._get(key) != value:
+            return False
+        self._keys[key] = (value, time.monotonic() + ttl)
+        return True
+
+    async def delete_if_equal(self, key: str, value: str) -> bool:
+        if self._get(key) != value:
+            return False
+        del self._keys[key]
+        return True
+
+    def _get(self, key: str) -> Optional[str]:
+        item = self._keys.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.monotonic():
+            del self._keys[key]
+            return None
+        return item[0]
+
+    async def close(self):
+        pass
+
+# 比较后再修改, 在 Redis 中用脚本保证原子性
+_HDEL_IF_EQUAL = "if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then return redis.call('HDEL', KEYS[1], ARGV[1]) end return 0"
+_RENEW = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end return 0"
+_DELETE_IF_EQUAL = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+class RedisBus:
+    """基于 Redis 的消息总线, 多个进程/节点共享; 需要安装 redis>=4.2"""
+
+    shared = True
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("使用 Redis 消息总线需要安装 redis>=4.2")
+        self._redis = redis.from_url(url, decode_responses=True)
+
+    async def publish(self, channel: str, message: str) -> int:
+        return await self._redis.publish(channel, message)
+
+    async def subscribe(self, *channels: str) -> AsyncIterator[Tuple[str, str]]:
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(*channels)
+        try:
+            async for item in pubsub.listen():
+                if item['type'] == 'message':
+                    yield item['channel'], item['data']
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+
+    async def hset(self, key: str, field: str, value: str):
+        await self._redis.hset(key, field, value)
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        return await self._redis.hget(key, field)
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return await self._redis.hgetall(key)
+
+    async def hdel(self, key: str, *fields: str) -> int:
+        return await self._redis.hdel(key, *fields) if fields else 0
+
+    async def hdel_if_equal(self, key: str, field: str, value: str) -> bool:
+        return bool(await self._redis.eval(_HDEL_IF_EQUAL, 1, key, field, value))
+
+    async def set_nx(self, key: str, value: str, ttl: float) -> bool:
+        return bool(await self._redis.set(key, value, nx=True, px=int(ttl * 1000)))
+
+    async def renew(self, key: str, value: str, ttl: float) -> bool:
+        return bool(await self._redis.eval(_RENEW, 1, key, value, int(ttl * 1000)))
+
+    async def delete_if_equal(self, key: str, value: str) -> bool:
+        return bool(await self._redis.eval(_DELETE_IF_EQUAL, 1, key, value))
+
+    async def close(self):
+        await self._redis.close()
+
+def create_bus(url: str):
+    """url 为空时使用进程内总线, 否则连接 Redis"""
+    if not url:
+        return LocalBus()
+    return RedisBus(url)
@@ -0,0 +1,92 @@
+from typing import List, Set
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from app.core.config import DB_IN_CHUNK_SIZE
+from app.models.models import Task
+
+# 在已有数据库上补加的列: (表, 列) -> 列定义; 新建的数据库由 generate_schemas 直接建出
+COLUMNS = {
+    ("task", "priority"): "INT NOT NULL DEFAULT 0",
+    ("task", "queue"): "VARCHAR(50) NOT NULL DEFAULT 'default'",
+    ("task", "requirements"): "VARCHAR(255) NOT NULL DEFAULT ''",
+    ("task", "node_id"): "VARCHAR(64)",
+}
+
+# 已被替换的索引, 启动时删除
+OBSOLETE_INDEXES = ["idx_task_status_queue_priority", "idx_user_points_username"]
+
+# 热点查询使用的索引, 启动时以 CREATE INDEX IF NOT EXISTS 补建, 对已有数据库同样生效
+INDEXES = {
+    # 预取待处理任务: WHERE status='pending' ORDER BY created_at; 也覆盖只按 status 的过滤和分组统计
+    "idx_task_status_created_at": 'CREATE INDEX IF NOT EXISTS idx_task_status_created_at ON task (status, created_at)',
+    # 按队列和能力要求分组预取: WHERE status='pending' AND queue=? AND requirements=?
+    # ORDER BY priority DESC, created_at; 也覆盖按 (queue, requirements) 去重
+    "idx_task_claim": 'CREATE INDEX IF NOT EXISTS idx_task_claim ON task (status, queue, requirements, priority DESC, created_at)',
+    # 载入/回收执行中的任务: WHERE status='in_progress' AND started_at <= ?
+    "idx_task_status_started_at": 'CREATE INDEX IF NOT EXISTS idx_task_status_started_at ON task (status, started_at)',
+    "idx_task_client_id": 'CREATE INDEX IF NOT EXISTS idx_task_client_id ON task (client_id)',
+    # /rank: ORDER BY points DESC, username (username 作为游标分页的唯一次序键), 索引方向与排序一致
+    "idx_user_points_desc_username": 'CREATE INDEX IF NOT EXISTS idx_user_points_desc_username ON "user" (points DESC, username)',
+    # /results 按 (created_at, id) 排序和游标分页, id 即 rowid, 已隐含在索引中
+    "idx_result_created_at": 'CREATE INDEX IF NOT EXISTS idx_result_created_at ON result (created_at)',
+    "idx_result_task_id": 'CREATE INDEX IF NOT EXISTS idx_result_task_id ON result (task_id)',
+    "idx_pointsledger_user_id": 'CREATE INDEX IF NOT EXISTS idx_pointsledger_user_id ON pointsledger (user_id)',
+}
+
+async def apply_migrations(connection_name: str = 'default'):
+    """补加缺少的列并补建索引, 可重复执行"""
+    connection = get_connection(connection_name)
+    existing = {}
+    for (table, column), definition in COLUMNS.items():
+        if table not in existing:
+            existing[table] = await get_columns(connection, table)
+        # 表还不存在时由 generate_schemas 创建, 无需补列
+        if existing[table] and column not in existing[table]:
+            await connection.execute_script(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            if (table, column) == ("task", "requirements"):
+                await backfill_task_requirements()
+    for name in OBSOLETE_INDEXES:
+        await connection.execute_script(f"DROP INDEX IF EXISTS {name}")
+    for sql in INDEXES.values():
+        await connection.execute_script(sql)
+
+async def backfill_task_requirements():
+    """为补列前已存在的未完成任务按 data 生成 requirements"""
+    groups = {}
+    for task_id, data in await Task.filter(status__in=['pending', 'queued']).values_list('id', 'data'):
+        requirements = Task.requirements_of(data)
+        if requirements:
+            groups.setdefault(requirements, []).append(task_id)
+    for requirements, ids in groups.items():
+        for i in range(0, len(ids), DB_IN_CHUNK_SIZE):
+            await Task.filter(id__in=ids[i:i + DB_IN_CHUNK_SIZE]).update(requirements=requirements)
+
+async def get_columns(connection: BaseDBAsyncClient, table: str) -> Set[str]:
+    """表的列名, 表不存在时为空集合"""
+    if is_postgres(connection):
+        _, rows = await connection.execute_query(
+            "SELECT column_name AS name FROM information_schema.columns WHERE table_name = $1", [table]
+        )
+    else:
+        _, rows = await connection.execute_query(f"PRAGMA table_info({table})")
+    return {row['name'] for row in rows}
+
+def get_connection(connection_name: str = 'default') -> BaseDBAsyncClient:
+    return Tortoise.get_connection(connection_name)
+
+def is_postgres(connection: BaseDBAsyncClient) -> bool:
+    return connection.capabilities.dialect == 'postgres'
+
+def format_sql(connection: BaseDBAsyncClient, query: str) -> str:
+    """SQL 统一用 ? 作占位符书写, PostgreSQL 下依次替换为 $1, $2, ..."""
+    if not is_postgres(connection):
+        return query
+    parts = query.split('?')
+    return parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], 1))
+
+def insert_ignore_sql(connection: BaseDBAsyncClient, table: str, columns: List[str], values: str) -> str:
+    """主键冲突时跳过的 INSERT 语句, values 为 VALUES 后的占位符部分"""
+    column_list = ', '.join(columns)
+    if is_postgres(connection):
+        return format_sql(connection, f"INSERT INTO {table} ({column_list}) VALUES {values} ON CONFLICT DO NOTHING")
+    return f"INSERT OR IGNORE INTO {table} ({column_list}) VALUES {values}"
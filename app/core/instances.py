@@ -1,5 +1,21 @@
 from app.services.task_manager import TaskManager
+from app.services.user_cache import UserCache
+from app.services.admission import TokenBucket
+from app.services.dispatcher import Dispatcher
+from app.services.broadcaster import Broadcaster
 from app.services.connection_manager import ConnectionManager
+from app.services.ledger_manager import LedgerManager
+from app.services.completion_pipeline import CompletionPipeline
+from app.services.cluster import Cluster
+from app.core.bus import create_bus
+from app.core.config import CLUSTER_BUS_URL, WS_ADMISSION_RATE, WS_ADMISSION_BURST
 
-task_manager = TaskManager()
-connection_manager = ConnectionManager(task_manager) 
\ No newline at end of file
+user_cache = UserCache()
+task_manager = TaskManager(user_cache)
+dispatcher = Dispatcher(task_manager)
+broadcaster = Broadcaster(task_manager)
+cluster = Cluster(create_bus(CLUSTER_BUS_URL), task_manager, dispatcher, broadcaster)
+connection_manager = ConnectionManager(task_manager, dispatcher, broadcaster, cluster)
+ledger_manager = LedgerManager()
+completion_pipeline = CompletionPipeline(task_manager, ledger_manager)
+admission = TokenBucket(WS_ADMISSION_RATE, WS_ADMISSION_BURST)
@@ -0,0 +1,45 @@
+import base64
+from datetime import datetime
+from typing import Any, List, Type
+from tortoise.query_utils import Q
+from app.core.serialization import dumps_bytes, loads
+
+def encode_cursor(*values: Any) -> str:
+    """把排序键编码为不透明游标, datetime 以 ISO 格式保存"""
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    return base64.urlsafe_b64encode(dumps_bytes(payload)).decode().rstrip('=')
+
+def decode_cursor(cursor: str, *types: Type) -> List[Any]:
+    """解析游标, types 为各排序键的类型; 格式或类型不对(如伪造的游标)时抛出 ValueError"""
+    try:
+        payload = loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("无效的游标")
+    if not isinstance(payload, list) or len(payload) != len(types):
+        raise ValueError("无效的游标")
+    values = []
+    for value, expected in zip(payload, types):
+        if expected is datetime:
+            try:
+                value = datetime.fromisoformat(value["dt"])
+            except (TypeError, KeyError, ValueError):
+                raise ValueError("无效的游标")
+        # bool 是 int 的子类, 不能当作整数排序键
+        elif not isinstance(value, expected) or isinstance(value, bool):
+            raise ValueError("无效的游标")
+        values.append(value)
+    return values
+
+def keyset_after(field: str, value: Any, tie_field: str, tie_value: Any, descending: bool = False) -> Q:
+    """(field, tie_field) 排序中位于游标之后的行; tie_field 总是升序
+
+    单独加上 field >= value 的范围条件, 数据库才能直接定位到游标处的索引位置,
+    只写 OR 条件时 SQLite 会从头扫描索引, 深分页耗时随页数增长。
+    """
+    op = 'lt' if descending else 'gt'
+    return Q(**{f"{field}__{op}e": value}) & (
+        Q(**{f"{field}__{op}": value}) | Q(**{f"{tie_field}__gt": tie_value})
+    )
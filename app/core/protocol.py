@@ -0,0 +1,162 @@
+import logging
+import uuid
+from typing import Any, Dict, List, Union
+from app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# WebSocket 帧: JSON 协议为文本, 二进制协议为字节
+Frame = Union[str, bytes]
+
+# 不带数据的消息, 每种协议启动时编码一次, 发送时直接复用
+CONSTANT_EVENTS = ('waiting',)
+
+class BaseProtocol:
+    """消息编码协议: encode 把消息编码为帧, decode 把客户端发来的帧解码为 {"event", "data"}"""
+
+    name = ''
+    binary = False
+
+    def __init__(self):
+        self._constants = {event: self._encode({"event": event}) for event in CONSTANT_EVENTS}
+
+    def encode(self, message: Dict[str, Any]) -> Frame:
+        if len(message) == 1:
+            frame = self._constants.get(message['event'])
+            if frame is not None:
+                return frame
+        return self._encode(message)
+
+    def _encode(self, message: Dict[str, Any]) -> Frame:
+        raise NotImplementedError
+
+    def encode_batch(self, frames: List[Frame]) -> Frame:
+        """把已编码的多条消息拼接为一个 batch 帧, 不重新序列化"""
+        raise NotImplementedError
+
+    def decode(self, frame: Frame) -> Dict[str, Any]:
+        raise NotImplementedError
+
+class JsonProtocol(BaseProtocol):
+    """默认协议: JSON 文本帧, 浏览器页面使用"""
+
+    name = 'json'
+
+    def _encode(self, message: Dict[str, Any]) -> Frame:
+        return dumps(message)
+
+    def encode_batch(self, frames: List[Frame]) -> Frame:
+        return '{"event":"batch","data":[' + ','.join(frames) + ']}'
+
+    def decode(self, frame: Frame) -> Dict[str, Any]:
+        return loads(frame)
+
+# 二进制协议中的事件编号
+EVENT_CODES = {
+    "init": 1, "new_task": 2, "new_tasks": 3, "waiting": 4, "points_update": 5,
+    "task_count": 6, "online_count": 7, "task_complete": 8, "tasks_complete": 9, "batch": 10
+}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+def _pack_id(task_id: str) -> Union[str, bytes]:
+    """标准格式的 UUID 转为 16 字节, 其他任务ID(导入时自定义的)保持字符串"""
+    try:
+        value = uuid.UUID(task_id)
+    except (ValueError, TypeError, AttributeError):
+        return task_id
+    return value.bytes if str(value) == task_id else task_id
+
+def _unpack_id(task_id: Union[str, bytes]) -> str:
+    return str(uuid.UUID(bytes=task_id)) if isinstance(task_id, bytes) else task_id
+
+def _pack_task(task: Dict[str, Any]) -> list:
+    return [_pack_id(task['id']), task['name'], task['data'], task['duration'], task['reward']]
+
+def _unpack_completion(item: list) -> Dict[str, Any]:
+    return {"task_id": _unpack_id(item[0]), "result": item[1]}
+
+def _check_json_compatible(value: Any):
+    """拒绝 JSON 无法表示的值(msgpack 的 bin、ext 类型, 非字符串的键)
+
+    这些值会原样进入完成记录, 写入结果的 JSON 字段时才失败。
+    """
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if value is None or isinstance(value, (bool, int, float, str)):
+            continue
+        if isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                if not isinstance(key, str):
+                    raise ValueError(f"消息中的键必须是字符串: {key!r}")
+                stack.append(item)
+        else:
+            raise ValueError(f"消息中包含 JSON 不支持的值: {type(value).__name__}")
+
+class MsgpackProtocol(BaseProtocol):
+    """msgpack 二进制帧: [事件编号, 数据], 需要安装 msgpack
+
+    高频消息的数据使用固定的数组布局, 不传字段名, 任务ID以 16 字节传输:
+    - new_task: [id, name, data, duration, reward]; new_tasks: 上述数组的列表
+    - task_complete: [task_id, result]; tasks_complete: 上述数组的列表
+    - batch: 多条消息的列表, 每条为 [事件编号, 数据]
+    其余消息的数据与 JSON 协议相同。解码后的消息与 JSON 协议的格式一致, 由同一套处理函数处理;
+    客户端消息中 JSON 无法表示的值(如 bin 类型的结果)解码时以 ValueError 拒绝。
+    """
+
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise RuntimeError("使用 msgpack 协议需要安装 msgpack")
+        self._packb = msgpack.packb
+        self._unpackb = msgpack.unpackb
+        self._packer = msgpack.Packer()
+        super().__init__()
+
+    def _encode(self, message: Dict[str, Any]) -> Frame:
+        event, data = message['event'], message.get('data')
+        if event == 'new_task':
+            data = _pack_task(data)
+        elif event == 'new_tasks':
+            data = [_pack_task(task) for task in data]
+        return self._packb([EVENT_CODES[event], data])
+
+    def encode_batch(self, frames: List[Frame]) -> Frame:
+        # [batch 编号, [消息, ...]]: 各消息本身就是完整的 msgpack 值, 写出数组头后直接拼接
+        return (
+            self._packer.pack_array_header(2) + self._packb(EVENT_CODES['batch'])
+            + self._packer.pack_array_header(len(frames)) + b''.join(frames)
+        )
+
+    def decode(self, frame: Frame) -> Dict[str, Any]:
+        code, data = self._unpackb(frame)
+        event = EVENT_NAMES.get(code)
+        if event == 'task_complete':
+            data = _unpack_completion(data)
+        elif event == 'tasks_complete':
+            data = [_unpack_completion(item) for item in data]
+        # 任务ID已还原为字符串, 其余数据须与 JSON 协议能表示的一致
+        _check_json_compatible(data)
+        return {"event": event, "data": data}
+
+JSON_PROTOCOL = JsonProtocol()
+PROTOCOLS = {'json': JsonProtocol, 'msgpack': MsgpackProtocol}
+_instances: Dict[str, Any] = {'json': JSON_PROTOCOL}
+
+def get_protocol(name: str):
+    """按名称返回协议实例; 未知协议或依赖未安装时返回 None"""
+    if name not in _instances:
+        if name not in PROTOCOLS:
+            return None
+        try:
+            _instances[name] = PROTOCOLS[name]()
+        except RuntimeError as e:
+            logger.warning("协议 %s 不可用: %s", name, e)
+            return None
+    return _instances[name]
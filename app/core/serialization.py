@@ -0,0 +1,41 @@
+"""JSON 序列化: 安装了 orjson 时使用 orjson, 否则使用标准库 json
+
+WebSocket 消息、集群总线消息、HTTP 响应和导入导出都经过这里, 更换实现只需修改本模块。
+两种实现的输出都是紧凑格式、不转义非 ASCII 字符, 结果可以互相解析。
+"""
+import json
+from typing import Any
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+
+if orjson:
+    # 允许非字符串的字典键(与 json 一样转为字符串)
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=_OPTIONS)
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=_OPTIONS).decode()
+
+    loads = orjson.loads
+else:
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return dumps(obj).encode()
+
+    loads = json.loads
+
+class FastJSONResponse(JSONResponse):
+    """用 dumps_bytes 渲染的 JSONResponse, 作为应用的默认响应类"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
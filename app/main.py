@@ -1,37 +1,61 @@
-from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from tortoise.contrib.fastapi import register_tortoise
+from tortoise import Tortoise
+from tortoise.exceptions import DoesNotExist, IntegrityError
 import asyncio
 
 from app.core.config import DB_CONFIG
-from app.core.instances import task_manager
+from app.core.database import apply_migrations
+from app.core.serialization import FastJSONResponse
+from app.core.instances import task_manager, completion_pipeline, dispatcher, broadcaster, cluster
 from app.api import endpoints, websocket
 from app.services.websocket_service import WebSocketService
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # 启动时运行
-    asyncio.create_task(WebSocketService.task_scheduler())
-    asyncio.create_task(WebSocketService.check_timeout_tasks())
-    yield
-    # 关闭时运行
-    pass
-
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # 注册路由
 app.include_router(endpoints.router)
 app.include_router(websocket.router)
 
-# 注册数据库
-register_tortoise(
-    app,
-    config=DB_CONFIG,
-    generate_schemas=True,
-    add_exception_handlers=True,
-)
+# 启动和关闭使用 on_event 注册: 固定版本的 FastAPI(0.68) 不支持 lifespan 参数,
+# 新版本在传入 lifespan 时又会忽略 on_event, 两者不能混用
+@app.on_event("startup")
+async def startup():
+    # 先初始化数据库, 后面的步骤都依赖它
+    await Tortoise.init(config=DB_CONFIG)
+    await Tortoise.generate_schemas()
+    await apply_migrations()
+    # 先登记本节点, 其他节点才不会把本节点的预取任务当作遗留任务回收
+    await cluster.start()
+    await task_manager.recover(cluster.live_nodes)
+    await task_manager.counter.load()
+    asyncio.create_task(task_manager.lease_writer())
+    completion_pipeline.start()
+    asyncio.create_task(dispatcher.run())
+    asyncio.create_task(broadcaster.run())
+    asyncio.create_task(WebSocketService.check_timeout_tasks())
+    asyncio.create_task(WebSocketService.reconcile_task_counts())
+    asyncio.create_task(WebSocketService.reap_orphaned_tasks())
+
+@app.on_event("shutdown")
+async def shutdown():
+    # 先写回所有已确认的完成记录, 再写回剩余租约, 最后关闭数据库连接
+    await completion_pipeline.close()
+    await task_manager.flush_leases()
+    await cluster.close()
+    await Tortoise.close_connections()
+
+@app.exception_handler(DoesNotExist)
+async def does_not_exist_handler(request: Request, exc: DoesNotExist):
+    return FastJSONResponse(status_code=404, content={"detail": str(exc)})
+
+@app.exception_handler(IntegrityError)
+async def integrity_error_handler(request: Request, exc: IntegrityError):
+    return FastJSONResponse(
+        status_code=422,
+        content={"detail": [{"loc": [], "msg": str(exc), "type": "IntegrityError"}]},
+    )
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000) 
\ No newline at end of file
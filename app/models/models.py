@@ -1,6 +1,8 @@
 from tortoise import fields, models
 from datetime import datetime
 
+# 查询索引统一在 app/core/database.py 中维护, 启动时补建
+
 class User(models.Model):
     id = fields.CharField(pk=True, max_length=36)
     username = fields.CharField(max_length=50, unique=True)
@@ -16,13 +18,27 @@ class Task(models.Model):
     name = fields.CharField(max_length=255)
     duration = fields.IntField()
     reward = fields.IntField()
-    status = fields.CharField(max_length=20, default='pending')  # pending/in_progress/completed
+    status = fields.CharField(max_length=20, default='pending')  # pending/queued/in_progress/completed
     client_id = fields.CharField(max_length=36, null=True)
+    node_id = fields.CharField(max_length=64, null=True)  # 持有执行中任务租约的节点
     data = fields.JSONField(null=True)  # 存储任务相关数据
+    priority = fields.IntField(default=0)  # 同一队列内数值大的先分配
+    queue = fields.CharField(max_length=50, default='default')  # 所属队列(活动)
+    requirements = fields.CharField(max_length=255, default='')  # 执行所需的客户端能力, 由 data.data_requirements 生成
     started_at = fields.DatetimeField(null=True)
     completed_at = fields.DatetimeField(null=True)
     created_at = fields.DatetimeField(auto_now_add=True)
     
+    @staticmethod
+    def requirements_of(data) -> str:
+        """把 data.data_requirements 规范化为排序、去重后逗号分隔的字符串, 没有要求时为空字符串"""
+        requirements = (data or {}).get('data_requirements') or []
+        if isinstance(requirements, str):
+            requirements = requirements.split(',')
+        if not isinstance(requirements, (list, tuple)):
+            return ''
+        return ','.join(sorted({str(item).strip() for item in requirements if str(item).strip()}))
+
     def __str__(self):
         return f"Task:{self.name}, reward:{self.reward}, status:{self.status}, client_id:{self.client_id}"
 
@@ -37,4 +53,13 @@ class Withdrawal(models.Model):
     user = fields.ForeignKeyField('models.User', related_name='withdrawals')
     amount = fields.IntField()
     status = fields.CharField(max_length=20, default='pending')
-    created_at = fields.DatetimeField(auto_now_add=True) 
\ No newline at end of file
+    created_at = fields.DatetimeField(auto_now_add=True) 
+
+class PointsLedger(models.Model):
+    """积分流水, 只追加不修改; delta 为正表示收入, 为负表示支出"""
+    id = fields.BigIntField(pk=True)
+    user = fields.ForeignKeyField('models.User', related_name='ledger_entries')
+    delta = fields.IntField()
+    reason = fields.CharField(max_length=20)  # task_reward/withdrawal
+    ref_id = fields.CharField(max_length=36, null=True)  # 关联的任务ID或提现ID
+    created_at = fields.DatetimeField(auto_now_add=True)
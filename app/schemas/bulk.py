@@ -0,0 +1,198 @@
+import os
+import uuid
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+# 批量校验任务, 逐列处理而不为每行构造 TaskCreate 对象。
+# 校验规则和错误信息与 TaskCreate 的字段定义及 validator 保持一致。
+
+_MISSING = object()
+_INVALID = object()
+
+def batch_uuid4(count: int) -> List[str]:
+    """一次读取随机字节, 批量生成 uuid4 字符串"""
+    raw = os.urandom(16 * count)
+    return [str(uuid.UUID(bytes=raw[i * 16:(i + 1) * 16], version=4)) for i in range(count)]
+
+def _to_str(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.value if isinstance(value, Enum) else value
+    if isinstance(value, (float, int, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    return _INVALID
+
+def _to_int(value: Any) -> Any:
+    if isinstance(value, int) and not (value is True or value is False):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        # OverflowError: 无穷大的浮点数(json 解析 Infinity 得到)
+        return _INVALID
+
+def _check_required(value: Any) -> Optional[Dict[str, Any]]:
+    if value is _MISSING:
+        return {"msg": "field required", "type": "value_error.missing"}
+    if value is None:
+        return {"msg": "none is not an allowed value", "type": "type_error.none.not_allowed"}
+    return None
+
+def _validate_names(values: List[Any]) -> Tuple[List[Any], Dict[int, Dict[str, Any]]]:
+    out, errors = [], {}
+    for i, value in enumerate(values):
+        error = _check_required(value)
+        if error is None:
+            value = _to_str(value)
+            if value is _INVALID:
+                error = {"msg": "str type expected", "type": "type_error.str"}
+            elif len(value) < 1:
+                error = {"msg": "ensure this value has at least 1 characters",
+                         "type": "value_error.any_str.min_length", "ctx": {"limit_value": 1}}
+            elif len(value) > 255:
+                error = {"msg": "ensure this value has at most 255 characters",
+                         "type": "value_error.any_str.max_length", "ctx": {"limit_value": 255}}
+            elif not value.isprintable():
+                error = {"msg": "包含非法字符", "type": "value_error"}
+        if error:
+            errors[i] = error
+            out.append(_INVALID)
+        else:
+            out.append(value.strip())
+    return out, errors
+
+def _validate_positive_ints(values: List[Any]) -> Tuple[List[Any], Dict[int, Dict[str, Any]]]:
+    out, errors = [], {}
+    for i, value in enumerate(values):
+        error = _check_required(value)
+        if error is None:
+            value = _to_int(value)
+            if value is _INVALID:
+                error = {"msg": "value is not a valid integer", "type": "type_error.integer"}
+            elif not value > 0:
+                error = {"msg": "ensure this value is greater than 0",
+                         "type": "value_error.number.not_gt", "ctx": {"limit_value": 0}}
+        if error:
+            errors[i] = error
+            out.append(_INVALID)
+        else:
+            out.append(value)
+    return out, errors
+
+def _validate_data(values: List[Any]) -> Tuple[List[Any], Dict[int, Dict[str, Any]]]:
+    out, errors = [], {}
+    for i, value in enumerate(values):
+        if value is _MISSING:
+            out.append({})
+            continue
+        if value is None:
+            errors[i] = {"msg": "none is not an allowed value", "type": "type_error.none.not_allowed"}
+            out.append(_INVALID)
+            continue
+        if not isinstance(value, dict):
+            try:
+                value = dict(value)
+            except (TypeError, ValueError):
+                errors[i] = {"msg": "value is not a valid dict", "type": "type_error.dict"}
+                out.append(_INVALID)
+                continue
+        out.append(value)
+    return out, errors
+
+def _validate_priorities(values: List[Any]) -> Tuple[List[Any], Dict[int, Dict[str, Any]]]:
+    out, errors = [], {}
+    for i, value in enumerate(values):
+        if value is _MISSING:
+            out.append(0)
+            continue
+        error = _check_required(value)
+        if error is None:
+            value = _to_int(value)
+            if value is _INVALID:
+                error = {"msg": "value is not a valid integer", "type": "type_error.integer"}
+        if error:
+            errors[i] = error
+            out.append(_INVALID)
+        else:
+            out.append(value)
+    return out, errors
+
+def _validate_queues(values: List[Any]) -> Tuple[List[Any], Dict[int, Dict[str, Any]]]:
+    out, errors = [], {}
+    for i, value in enumerate(values):
+        if value is _MISSING:
+            out.append('default')
+            continue
+        error = _check_required(value)
+        if error is None:
+            value = _to_str(value)
+            if value is _INVALID:
+                error = {"msg": "str type expected", "type": "type_error.str"}
+            elif len(value) < 1:
+                error = {"msg": "ensure this value has at least 1 characters",
+                         "type": "value_error.any_str.min_length", "ctx": {"limit_value": 1}}
+            elif len(value) > 50:
+                error = {"msg": "ensure this value has at most 50 characters",
+                         "type": "value_error.any_str.max_length", "ctx": {"limit_value": 50}}
+        if error:
+            errors[i] = error
+            out.append(_INVALID)
+        else:
+            out.append(value)
+    return out, errors
+
+def _validate_ids(values: List[Any]) -> Tuple[List[Any], Dict[int, Dict[str, Any]]]:
+    # 与 set_id 相同: 缺失或为假值时生成新ID
+    missing = [i for i, value in enumerate(values) if value is _MISSING or not value]
+    out = list(values)
+    for i, generated in zip(missing, batch_uuid4(len(missing))):
+        out[i] = generated
+    errors = {}
+    for i, value in enumerate(out):
+        value = _to_str(value)
+        if value is _INVALID:
+            errors[i] = {"msg": "str type expected", "type": "type_error.str"}
+        out[i] = value
+    return out, errors
+
+_COLUMNS = (
+    ("name", _validate_names),
+    ("duration", _validate_positive_ints),
+    ("reward", _validate_positive_ints),
+    ("data", _validate_data),
+    ("priority", _validate_priorities),
+    ("queue", _validate_queues),
+    ("id", _validate_ids),
+)
+
+def validate_tasks(records: List[Any]) -> Tuple[List[Optional[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """批量校验任务记录
+
+    返回 (tasks, errors): tasks 与 records 按行对齐, 校验通过的行为与 TaskCreate(...).dict()
+    相同的字典, 未通过的行为 None; errors 中每项为 {"row", "loc", "msg", "type"[, "ctx"]},
+    同一行的多个错误按字段顺序排列。
+    """
+    row_errors: Dict[int, List[Dict[str, Any]]] = {}
+    rows = []  # 记录为对象的行号
+    for i, record in enumerate(records):
+        if isinstance(record, dict):
+            rows.append(i)
+        else:
+            row_errors[i] = [{"row": i, "loc": [], "msg": "value is not a valid dict", "type": "type_error.dict"}]
+
+    columns = {}
+    for field, validator in _COLUMNS:
+        values, errors = validator([records[i].get(field, _MISSING) for i in rows])
+        columns[field] = values
+        for j, error in errors.items():
+            row_errors.setdefault(rows[j], []).append({"row": rows[j], "loc": [field], **error})
+
+    tasks: List[Optional[Dict[str, Any]]] = [None] * len(records)
+    for j, i in enumerate(rows):
+        if i not in row_errors:
+            tasks[i] = {field: columns[field][j] for field, _ in _COLUMNS}
+
+    errors = [error for i in sorted(row_errors) for error in row_errors[i]]
+    return tasks, errors
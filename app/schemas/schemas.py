@@ -10,6 +10,8 @@ class TaskCreate(BaseModel):
     duration: int = Field(..., gt=0)
     reward: int = Field(..., gt=0)
     data: dict = Field(default={})  # 任务数据，默认为空字典
+    priority: int = Field(default=0)  # 同一队列内数值大的先分配
+    queue: str = Field(default='default', min_length=1, max_length=50)  # 所属队列(活动), 队列之间按权重公平分配
     id: str = None
 
     @validator('id', pre=True, always=True)
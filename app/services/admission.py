@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """令牌桶: 按 rate 个/秒的速度补充令牌, 最多积累 burst 个
+
+    令牌不足时按到达顺序预约后续的令牌并等待, 大量请求同时到达时被均匀地放行;
+    需要等待超过 max_wait 秒的请求直接拒绝, 不再排队。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self, max_wait: float) -> bool:
+        """取得一个令牌返回 True, 需要等待过久时返回 False"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # 令牌可以透支, 透支的数量就是排在前面的请求数
+        wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+        if wait > max_wait:
+            return False
+        self._tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
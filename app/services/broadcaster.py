@@ -0,0 +1,53 @@
+import asyncio
+from typing import Dict, Any, Set
+from app.core.config import BROADCAST_COALESCE_INTERVAL
+from app.services.task_manager import TaskManager
+
+class Broadcaster:
+    """向所有在线客户端广播消息
+
+    消息每种协议只序列化一次, 放入各连接的发送队列, 由连接自己的写协程发送并限时;
+    task_count/online_count 这类状态更新先标记, 由后台循环合并, 每个间隔最多推送一次。
+    """
+
+    def __init__(self, task_manager: TaskManager):
+        self.task_manager = task_manager
+        self._dirty: Set[str] = set()
+        self._wakeup = asyncio.Event()
+
+    def broadcast(self, message: Dict[str, Any]) -> int:
+        """返回成功入队的客户端数"""
+        event = message.get('event')
+        frames = {}
+        sent = 0
+        for connection in list(self.task_manager.clients.values()):
+            protocol = connection.protocol
+            if protocol.name not in frames:
+                frames[protocol.name] = protocol.encode(message)
+            sent += connection.send_frame(frames[protocol.name], event)
+        return sent
+
+    def publish_task_count(self):
+        self._dirty.add('task_count')
+        self._wakeup.set()
+
+    def publish_online_count(self):
+        self._dirty.add('online_count')
+        self._wakeup.set()
+
+    def _build_message(self, event: str) -> Dict[str, Any]:
+        if event == 'task_count':
+            return {
+                "event": "task_count",
+                "data": {"total_tasks": self.task_manager.get_pending_tasks_count()}
+            }
+        return {"event": "online_count", "data": self.task_manager.get_online_count()}
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            dirty, self._dirty = self._dirty, set()
+            for event in dirty:
+                self.broadcast(self._build_message(event))
+            await asyncio.sleep(BROADCAST_COALESCE_INTERVAL)
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Deque, List, Optional
+from fastapi import WebSocket
+from app.core.config import (
+    CLIENT_SEND_QUEUE_SIZE, CLIENT_SEND_TIMEOUT, CLIENT_SEND_OVERFLOW_POLICY, CLIENT_BATCH_WINDOW,
+    CLIENT_BATCH_MAX_MESSAGES
+)
+from app.core.protocol import Frame, JSON_PROTOCOL
+
+logger = logging.getLogger(__name__)
+
+# 只关心最新值的状态类消息, 排队时新消息覆盖旧消息
+STATE_EVENTS = {'task_count', 'online_count'}
+
+class ClientConnection:
+    """单个 WebSocket 连接的有界发送队列和写协程
+
+    调用方只入队不等待网络 I/O; 状态类消息只保留最新一条, 其他消息超出队列上限时
+    按 CLIENT_SEND_OVERFLOW_POLICY 丢弃或断开客户端。消息按连接协商的协议编码为文本帧或二进制帧。
+    batch 为真时, 写协程把 CLIENT_BATCH_WINDOW 内产生的消息(如完成后的积分更新、任务数和新任务)
+    合并为一个 {"event": "batch", "data": [...]} 帧发送。
+    """
+
+    def __init__(self, client_id: str, websocket: WebSocket, protocol=JSON_PROTOCOL, batch: bool = False):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.protocol = protocol
+        self.batch = batch
+        self.closed = False
+        self._queue: Deque[Frame] = deque()
+        self._state_updates: Dict[str, Frame] = {}
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, message: Dict[str, Any]) -> bool:
+        return self.send_frame(self.protocol.encode(message), message.get('event'))
+
+    def send_frame(self, frame: Frame, event: Optional[str] = None) -> bool:
+        """已按本连接的协议编码的消息入队, 返回是否入队成功"""
+        if self.closed:
+            return False
+        if event in STATE_EVENTS:
+            self._state_updates[event] = frame
+        elif len(self._queue) >= CLIENT_SEND_QUEUE_SIZE:
+            logger.warning("客户端 %s 发送队列已满", self.client_id)
+            if CLIENT_SEND_OVERFLOW_POLICY == 'disconnect':
+                self._abort(code=1013)
+            return False
+        else:
+            self._queue.append(frame)
+        self._ready.set()
+        return True
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                if self.batch:
+                    # 稍等片刻, 被同一操作唤醒的分发器、广播器把消息放入队列后一起发送
+                    await asyncio.sleep(CLIENT_BATCH_WINDOW)
+                while self._queue or self._state_updates:
+                    frames = self._take(CLIENT_BATCH_MAX_MESSAGES if self.batch else 1)
+                    frame = frames[0] if len(frames) == 1 else self.protocol.encode_batch(frames)
+                    if isinstance(frame, bytes):
+                        await asyncio.wait_for(self.websocket.send_bytes(frame), CLIENT_SEND_TIMEOUT)
+                    else:
+                        await asyncio.wait_for(self.websocket.send_text(frame), CLIENT_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("向客户端 %s 发送失败, 断开连接: %r", self.client_id, e)
+            self._abort(code=1011)
+
+    def _take(self, limit: int) -> List[Frame]:
+        """按顺序取出最多 limit 条待发送的消息, 普通消息在前, 状态消息在后"""
+        frames = []
+        while self._queue and len(frames) < limit:
+            frames.append(self._queue.popleft())
+        while self._state_updates and len(frames) < limit:
+            frames.append(self._state_updates.popitem()[1])
+        return frames
+
+    def stop(self):
+        """停止写协程并丢弃未发送的消息"""
+        self.closed = True
+        self._queue.clear()
+        self._state_updates.clear()
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    def _abort(self, code: int):
+        """立即停止发送, 后台关闭 WebSocket; 接收循环随后收到断开并清理连接"""
+        if self.closed:
+            return
+        self.stop()
+        asyncio.create_task(self._close_websocket(code))
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.stop()
+        await self._close_websocket(code)
+
+    async def _close_websocket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
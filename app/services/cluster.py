@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from typing import Any, Collection, Dict, List, Optional, Set, Tuple
+from app.core.config import (
+    NODE_ID, CLUSTER_HEARTBEAT_INTERVAL, CLUSTER_NODE_TTL, CLUSTER_LEADER_TTL, CLUSTER_OUTBOX_SIZE
+)
+from app.core.serialization import dumps, loads
+from app.services.task_manager import TaskManager
+from app.services.dispatcher import Dispatcher
+from app.services.broadcaster import Broadcaster
+
+logger = logging.getLogger(__name__)
+
+NODES_KEY = 'cluster:nodes'
+CLIENTS_KEY = 'cluster:clients'
+EVENTS_CHANNEL = 'cluster:events'
+LEADER_KEY = 'cluster:leader:{}'
+NODE_CHANNEL = 'cluster:node:{}'
+
+class Cluster:
+    """集群协调: 节点心跳、客户端归属、跨节点消息转发和主节点选举
+
+    每个进程是一个节点, 只持有连到自己的客户端和自己预取的任务, 任务分发和租约回收都在本地进行;
+    节点之间通过消息总线登记客户端所在节点, 转发发给其他节点客户端的消息, 并广播新任务等事件。
+    全局的后台任务按角色选主, 只在主节点上执行:
+    scheduler 校准任务计数并同步给其他节点, reaper 回收失效节点遗留的任务。
+    """
+
+    ROLES = ('scheduler', 'reaper')
+
+    def __init__(self, bus, task_manager: TaskManager, dispatcher: Dispatcher, broadcaster: Broadcaster,
+                 node_id: str = NODE_ID):
+        self.bus = bus
+        self.task_manager = task_manager
+        self.dispatcher = dispatcher
+        self.broadcaster = broadcaster
+        self.node_id = node_id
+        self.live_nodes: Set[str] = {node_id}
+        self._leader_roles: Set[str] = set()
+        # 待执行的总线写操作 (协程函数, 参数), 由后台协程按顺序执行, 调用方不等待网络 I/O
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=CLUSTER_OUTBOX_SIZE)
+        self._tasks: List[asyncio.Task] = []
+        task_manager.router = self.route
+
+    async def start(self):
+        """先登记本节点并参与选主, 再启动后台协程"""
+        await self._heartbeat_once()
+        self._tasks = [
+            asyncio.create_task(self._heartbeat()),
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._drain_outbox()),
+        ]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        while not self._outbox.empty():
+            func, args = self._outbox.get_nowait()
+            await func(*args)
+        # 主动让出主节点身份并注销, 其他节点不必等到超时
+        for role in self._leader_roles:
+            await self.bus.delete_if_equal(LEADER_KEY.format(role), self.node_id)
+        self._leader_roles.clear()
+        await self.bus.hdel(NODES_KEY, self.node_id)
+        await self.bus.close()
+
+    def is_leader(self, role: str) -> bool:
+        return role in self._leader_roles
+
+    # 节点心跳与选主
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(CLUSTER_HEARTBEAT_INTERVAL)
+            try:
+                await self._heartbeat_once()
+            except Exception:
+                logger.exception("集群心跳失败")
+
+    async def _heartbeat_once(self):
+        now = time.time()
+        await self.bus.hset(NODES_KEY, self.node_id, dumps({
+            "clients": len(self.task_manager.clients), "ts": now
+        }))
+        live_counts = {}
+        for node, info in (await self.bus.hgetall(NODES_KEY)).items():
+            info = loads(info)
+            if now - info['ts'] <= CLUSTER_NODE_TTL:
+                live_counts[node] = info['clients']
+        self.live_nodes = set(live_counts)
+
+        remote_count = sum(count for node, count in live_counts.items() if node != self.node_id)
+        if remote_count != self.task_manager.remote_client_count:
+            self.task_manager.remote_client_count = remote_count
+            self.broadcaster.publish_online_count()
+
+        for role in self.ROLES:
+            key = LEADER_KEY.format(role)
+            if role in self._leader_roles:
+                elected = await self.bus.renew(key, self.node_id, CLUSTER_LEADER_TTL)
+            else:
+                elected = await self.bus.set_nx(key, self.node_id, CLUSTER_LEADER_TTL)
+            if elected:
+                self._leader_roles.add(role)
+            elif role in self._leader_roles:
+                self._leader_roles.discard(role)
+                logger.warning("节点 %s 失去 %s 主节点身份", self.node_id, role)
+
+    async def prune_dead_nodes(self) -> Set[str]:
+        """删除已失效节点的心跳记录和客户端归属, 返回当前存活的节点"""
+        now = time.time()
+        nodes = await self.bus.hgetall(NODES_KEY)
+        dead = [node for node, info in nodes.items() if now - loads(info)['ts'] > CLUSTER_NODE_TTL]
+        if dead:
+            await self.bus.hdel(NODES_KEY, *dead)
+            owners = await self.bus.hgetall(CLIENTS_KEY)
+            await self.bus.hdel(CLIENTS_KEY, *[client for client, node in owners.items() if node in dead])
+        return set(nodes) - set(dead)
+
+    # 客户端归属
+
+    def client_connected(self, client_id: str):
+        self._enqueue(self.bus.hset, CLIENTS_KEY, client_id, self.node_id)
+
+    def client_disconnected(self, client_id: str):
+        # 客户端可能已重连到其他节点, 只删除仍指向本节点的归属
+        self._enqueue(self.bus.hdel_if_equal, CLIENTS_KEY, client_id, self.node_id)
+
+    # 消息转发与事件
+
+    def route(self, client_id: str, message: Dict[str, Any]) -> bool:
+        """把消息转发给客户端所在的节点"""
+        return self._enqueue(self._route, client_id, message)
+
+    async def _route(self, client_id: str, message: Dict[str, Any]):
+        node = await self.bus.hget(CLIENTS_KEY, client_id)
+        if node and node != self.node_id:
+            await self.bus.publish(NODE_CHANNEL.format(node), dumps({
+                "client_id": client_id, "message": message
+            }))
+
+    def tasks_available(self, added: int = 0, groups: Optional[Collection[Tuple[str, str]]] = None):
+        """本节点新增或回收了任务, 通知其他节点唤醒分发; groups 为任务所属的分组, 未知时为 None"""
+        event = {"type": "tasks_available", "added": added}
+        if groups is not None:
+            event["groups"] = [list(group) for group in groups]
+        self._publish_event(event)
+
+    def points_changed(self, client_id: str, delta: int):
+        """本节点处理的积分变动(任务完成、提现)同步到其他节点的用户缓存"""
+        self._publish_event({"type": "points_changed", "client_id": client_id, "delta": delta})
+
+    def publish_counts(self):
+        """scheduler 主节点校准任务计数后同步给其他节点"""
+        self._publish_event({"type": "task_counts", "counts": self.task_manager.counter.as_dict()})
+
+    def _publish_event(self, event: Dict[str, Any]):
+        event['node'] = self.node_id
+        self._enqueue(self.bus.publish, EVENTS_CHANNEL, dumps(event))
+
+    def _handle_event(self, event: Dict[str, Any]):
+        if event['node'] == self.node_id:
+            return
+        if event['type'] == 'tasks_available':
+            if event['added']:
+                self.task_manager.counter.tasks_added(event['added'])
+            groups = event.get('groups')
+            self.dispatcher.tasks_available(None if groups is None else [tuple(group) for group in groups])
+            self.broadcaster.publish_task_count()
+        elif event['type'] == 'task_counts':
+            self.task_manager.counter.restore(event['counts'])
+            self.broadcaster.publish_task_count()
+        elif event['type'] == 'points_changed':
+            self.task_manager.user_cache.add_points(event['client_id'], event['delta'])
+
+    async def _listen(self):
+        while True:
+            try:
+                async for channel, data in self.bus.subscribe(NODE_CHANNEL.format(self.node_id), EVENTS_CHANNEL):
+                    payload = loads(data)
+                    if channel == EVENTS_CHANNEL:
+                        self._handle_event(payload)
+                        continue
+                    connection = self.task_manager.clients.get(payload['client_id'])
+                    if connection:
+                        connection.send(payload['message'])
+            except Exception:
+                logger.exception("集群消息订阅中断, 稍后重新订阅")
+                await asyncio.sleep(1)
+
+    def _enqueue(self, func, *args) -> bool:
+        try:
+            self._outbox.put_nowait((func, args))
+            return True
+        except asyncio.QueueFull:
+            logger.warning("集群消息队列已满, 丢弃 %s", func.__name__)
+            return False
+
+    async def _drain_outbox(self):
+        while True:
+            func, args = await self._outbox.get()
+            try:
+                await func(*args)
+            except Exception:
+                logger.exception("集群消息总线操作失败: %s", func.__name__)
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional
+from tortoise import timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+from app.core.config import (
+    COMPLETION_BATCH_SIZE, COMPLETION_FLUSH_INTERVAL, COMPLETION_BACKLOG,
+    COMPLETION_RETRY_DELAY, COMPLETION_RETRY_MAX_DELAY
+)
+from app.models.models import Task, Result
+from app.services.task_manager import TaskManager
+from app.services.ledger_manager import LedgerManager
+
+logger = logging.getLogger(__name__)
+
+# 记录本身导致的写入失败, 重试也不会成功; 其他异常(连接断开、数据库锁定等)视为暂时故障
+RECORD_ERRORS = (IntegrityError, TypeError, ValueError)
+
+class CompletionPipeline:
+    """任务完成写回管道: 提交后立即返回, 按时间或数量合并成一个事务落库"""
+
+    def __init__(self, task_manager: TaskManager, ledger_manager: LedgerManager):
+        self.task_manager = task_manager
+        self.ledger_manager = ledger_manager
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=COMPLETION_BACKLOG)
+        self._batch: List[Dict[str, Any]] = []  # 已取出但尚未写回的完成记录
+        self._runner: Optional[asyncio.Task] = None
+
+    async def submit(self, completion: Dict[str, Any]):
+        """提交一条完成记录, 积压达到上限时等待"""
+        await self.queue.put(completion)
+
+    @property
+    def backlog(self) -> int:
+        """已确认但尚未写回数据库的完成数"""
+        return self.queue.qsize() + len(self._batch)
+
+    def start(self):
+        self._runner = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self.queue.get())
+            deadline = loop.time() + COMPLETION_FLUSH_INTERVAL
+            while len(self._batch) < COMPLETION_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush_with_retry()
+
+    async def close(self):
+        """关闭时停止后台写回, 并把剩余的完成记录全部落库"""
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        while not self.queue.empty():
+            self._batch.append(self.queue.get_nowait())
+            if len(self._batch) >= COMPLETION_BATCH_SIZE:
+                await self._flush_with_retry()
+        await self._flush_with_retry()
+
+    async def _flush_with_retry(self):
+        """写回当前批次, 数据库暂时不可用时退避后重试直到成功
+
+        完成记录已经向客户端确认, 不能因为数据库故障丢弃; 重试期间队列逐渐积满, submit 随之等待, 形成背压。
+        记录本身无法写入(结果无法序列化、违反约束)时不重试, 由 _write 拆开批次隔离出这条记录。
+        """
+        attempt = 0
+        while self._batch:
+            try:
+                await self._write(list(self._batch))
+            except Exception:
+                attempt += 1
+                delay = min(COMPLETION_RETRY_DELAY * 2 ** (attempt - 1), COMPLETION_RETRY_MAX_DELAY)
+                logger.exception("任务完成写回失败 (第%d次, %s秒后重试, 积压 %d)", attempt, delay, self.backlog)
+                await asyncio.sleep(delay)
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        """写回 batch, 写入的记录从当前批次中移除; 记录错误时二分批次, 其余记录照常写回
+
+        无法写入的单条记录记入错误日志后丢弃, 不阻塞后面的完成记录。
+        """
+        try:
+            await self.flush(batch)
+        except RECORD_ERRORS:
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                await self._write(batch[:middle])
+                await self._write(batch[middle:])
+                return
+            completion = batch[0]
+            logger.exception(
+                "任务 %s 的完成记录无法写入, 已丢弃 (客户端 %s, 奖励 %s)",
+                completion['task_id'], completion['client_id'], completion['reward']
+            )
+        self._remove(batch)
+
+    def _remove(self, batch: List[Dict[str, Any]]):
+        written = {id(completion) for completion in batch}
+        self._batch = [completion for completion in self._batch if id(completion) not in written]
+
+    async def flush(self, batch: List[Dict[str, Any]]):
+        """在一个事务中批量更新任务状态、插入结果并记入积分流水"""
+        # 先写回租约, 保证任务行上有 client_id 和 started_at
+        await self.task_manager.flush_leases()
+
+        async with in_transaction():
+            await Task.filter(id__in=[c['task_id'] for c in batch]).update(
+                status='completed',
+                completed_at=timezone.now()
+            )
+            await Result.bulk_create([
+                Result(task_id=c['task_id'], result_data={'data': c['result']})
+                for c in batch
+            ])
+            await self.ledger_manager.credit([
+                {
+                    "client_id": c['client_id'],
+                    "delta": c['reward'],
+                    "reason": 'task_reward',
+                    "ref_id": c['task_id']
+                }
+                for c in batch
+            ])
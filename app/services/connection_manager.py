@@ -1,38 +1,66 @@
+import asyncio
+from typing import Any, Dict, FrozenSet
 from fastapi import WebSocket
-from app.models.models import User
 from app.services.task_manager import TaskManager
-import json
+from app.services.dispatcher import Dispatcher
+from app.services.broadcaster import Broadcaster
+from app.services.client_connection import ClientConnection
+from app.services.cluster import Cluster
+from app.core.protocol import JSON_PROTOCOL
 
 class ConnectionManager:
-    def __init__(self, task_manager: TaskManager):
+    def __init__(self, task_manager: TaskManager, dispatcher: Dispatcher, broadcaster: Broadcaster, cluster: Cluster):
         self.task_manager = task_manager
+        self.dispatcher = dispatcher
+        self.broadcaster = broadcaster
+        self.cluster = cluster
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.task_manager.clients[client_id] = websocket
-        self.task_manager.client_states[client_id] = 'idle'  # 初始化为空闲状态
-        await self.send_initial_data(websocket, client_id)
-        await self.try_assign_task(client_id)
+    async def connect(self, websocket: WebSocket, client_id: str, user: Dict[str, Any], window: int = 1,
+                      capabilities: FrozenSet[str] = frozenset(), protocol=JSON_PROTOCOL, batch: bool = False):
+        """建立连接并返回 ClientConnection
 
-    async def send_initial_data(self, websocket: WebSocket, client_id: str):
-        user_points = (await User.get_or_create(id=client_id))[0].points
-        user = await User.get_or_none(id=client_id)
+        user 为握手时从 UserCache 取得的用户信息, 连接期间固定在缓存中。
+        同一客户端的旧连接以 4000 关闭; 客户端仍持有的租约任务重新发送, 不再分配新任务占用这些位置。
+        中途出错(如重发租约时查询数据库失败)时撤销登记再抛出, 分发器不会继续向这个连接分配任务。
+        """
+        await websocket.accept()
+        connection = ClientConnection(client_id, websocket, protocol, batch)
+        connection.start()
+        old = self.task_manager.clients.get(client_id)
+        if old:
+            asyncio.create_task(old.close(code=4000))
+        self.task_manager.user_cache.pin(client_id, user)
+        self.task_manager.add_client(client_id, connection, window, capabilities)
+        try:
+            self.cluster.client_connected(client_id)
+            self.send_initial_data(connection, user)
+            await self.task_manager.resume_leases(client_id)
+        except BaseException:
+            self.disconnect(client_id, connection)
+            raise
+        self.dispatcher.worker_idle(client_id)
+        self.broadcaster.publish_online_count()
+        return connection
 
-        await websocket.send_text(json.dumps({
+    def send_initial_data(self, connection: ClientConnection, user: Dict[str, Any]):
+        # 用户信息来自缓存, 任务数来自计数器, 不访问数据库
+        connection.send({
             "event": "init",
             "data": {
-                "online_clients": len(self.task_manager.clients),
-                "total_tasks": await self.task_manager.get_pending_tasks_count(),
-                "points": user_points,
-                "username": user.username
+                "online_clients": self.task_manager.get_online_count(),
+                "total_tasks": self.task_manager.get_pending_tasks_count(),
+                "points": user['points'],
+                "username": user['username']
             }
-        }))
-
-    async def try_assign_task(self, client_id: str):
-        await self.task_manager.try_assign_task(client_id)
+        })
 
-    def disconnect(self, client_id: str):
-        if client_id in self.task_manager.clients:
-            del self.task_manager.clients[client_id]
-            if client_id in self.task_manager.client_states:
-                del self.task_manager.client_states[client_id]  # 清理状态 
\ No newline at end of file
+    def disconnect(self, client_id: str, connection: ClientConnection):
+        """连接断开; 已被同一客户端的新连接取代时只停止这个连接, 不清理客户端状态"""
+        connection.stop()
+        if self.task_manager.clients.get(client_id) is not connection:
+            return
+        self.dispatcher.worker_gone(client_id)
+        self.task_manager.remove_client(client_id)
+        self.task_manager.user_cache.unpin(client_id)
+        self.cluster.client_disconnected(client_id)
+        self.broadcaster.publish_online_count()
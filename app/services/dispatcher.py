@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from itertools import islice
+from typing import Collection, Optional, Tuple
+from app.core.config import DISPATCH_CHOICES, DISPATCH_RETRY_DELAY
+from app.services.task_manager import TaskManager
+
+logger = logging.getLogger(__name__)
+
+class Dispatcher:
+    """事件驱动的任务分发器
+
+    在新增任务、任务完成、客户端连接、任务超时等信号到来时唤醒, 按 TaskManager
+    中空闲客户端的先后顺序和它们能执行的待处理任务配对, 不做周期性的数据库扫描。
+    """
+
+    def __init__(self, task_manager: TaskManager):
+        self.task_manager = task_manager
+        # 变为空闲后还未收到 waiting 消息的客户端
+        self._unnotified: 'OrderedDict[str, None]' = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def worker_idle(self, client_id: str):
+        """客户端连接或完成任务后变为空闲"""
+        self._unnotified[client_id] = None
+        self._wakeup.set()
+
+    def worker_gone(self, client_id: str):
+        """客户端断开连接"""
+        self._unnotified.pop(client_id, None)
+
+    def tasks_available(self, groups: Optional[Collection[Tuple[str, str]]] = None):
+        """有新的待处理任务(新增或超时回收), groups 为它们所属的 (queue, requirements) 分组, 未知时为 None"""
+        self.task_manager.notify_tasks_available(groups)
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self.dispatch()
+            except Exception:
+                # 出错时空闲客户端可能没有分到任务, 稍后重新分发
+                logger.exception("任务分发失败, %s秒后重试", DISPATCH_RETRY_DELAY)
+                await asyncio.sleep(DISPATCH_RETRY_DELAY)
+                self._wakeup.set()
+
+    async def dispatch(self) -> int:
+        """为空闲客户端分配任务, 返回本次分配的任务数
+
+        按能力要求分区匹配: 要求多的分区先选, 每个分区从能执行它的空闲客户端中选择(见 _choose);
+        没有客户端能执行的任务留在内存中, 不阻塞其他分区。
+        """
+        assigned_count = 0
+        task_manager = self.task_manager
+        async with self._lock:
+            while True:
+                await task_manager.ensure_ready()
+                progress = 0
+                for key in task_manager.ready_requirements():
+                    idle_clients = task_manager.idle_index[key]
+                    while idle_clients and task_manager.ready.get(key):
+                        client_id = self._choose(idle_clients)
+                        assigned = await task_manager.assign_tasks(client_id)
+                        if not assigned:
+                            break
+                        self._unnotified.pop(client_id, None)
+                        progress += assigned
+                if not progress:
+                    break
+                assigned_count += progress
+            # 剩下的空闲客户端没有可执行的任务
+            self._notify_waiting()
+        return assigned_count
+
+    def _choose(self, idle_clients: 'OrderedDict[str, None]') -> str:
+        """在最早变为空闲的 DISPATCH_CHOICES 个客户端中, 选预计最快成功完成任务的一个
+
+        只比较少数几个候选, 开销与空闲客户端数量无关; 慢速或经常超时的客户端在任务不足时被跳过,
+        任务充足时所有空闲客户端仍都会分到任务。
+        """
+        candidates = list(islice(idle_clients, DISPATCH_CHOICES))
+        if len(candidates) == 1:
+            return candidates[0]
+        return min(candidates, key=self.task_manager.expected_completion)
+
+    def _notify_waiting(self):
+        """没有待处理任务时, 每个客户端在一次空闲期内只通知一次; 手上还有任务的客户端不通知"""
+        while self._unnotified:
+            client_id, _ = self._unnotified.popitem(last=False)
+            if self.task_manager.is_idle(client_id) and client_id not in self.task_manager.busy_clients:
+                self.task_manager.send_to_client(client_id, {"event": "waiting"})
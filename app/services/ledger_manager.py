@@ -0,0 +1,55 @@
+from collections import defaultdict
+from typing import Dict, List, Optional
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+from app.models.models import User, Withdrawal, PointsLedger
+
+class LedgerManager:
+    """积分账本: 所有积分变动都以 SQL 原子更新完成, 并追加一条流水"""
+
+    async def credit(self, entries: List[Dict]):
+        """批量入账, entries 中每项包含 client_id、delta、reason、ref_id
+
+        同一用户的多笔变动合并为一条 points = points + delta 更新。
+        调用方负责提供事务。
+        """
+        if not entries:
+            return
+        totals: Dict[str, int] = defaultdict(int)
+        for entry in entries:
+            totals[entry['client_id']] += entry['delta']
+
+        await PointsLedger.bulk_create([
+            PointsLedger(
+                user_id=entry['client_id'],
+                delta=entry['delta'],
+                reason=entry['reason'],
+                ref_id=entry.get('ref_id')
+            )
+            for entry in entries
+        ])
+        for client_id, delta in totals.items():
+            if delta:
+                await User.filter(id=client_id).update(points=F('points') + delta)
+
+    async def withdraw(self, client_id: str, amount: int) -> Optional[Withdrawal]:
+        """条件扣减积分, 余额不足时返回 None"""
+        async with in_transaction():
+            # UPDATE user SET points = points - amount WHERE id = ? AND points >= amount
+            updated = await User.filter(id=client_id, points__gte=amount).update(
+                points=F('points') - amount
+            )
+            if not updated:
+                return None
+            withdrawal = await Withdrawal.create(
+                user_id=client_id,
+                amount=amount,
+                status='pending'
+            )
+            await PointsLedger.create(
+                user_id=client_id,
+                delta=-amount,
+                reason='withdrawal',
+                ref_id=str(withdrawal.id)
+            )
+        return withdrawal
@@ -0,0 +1,66 @@
+import heapq
+import itertools
+from typing import Any, Dict, List, Optional, Tuple
+
+class ReadyQueues:
+    """按队列(活动)分组的就绪任务, 队列之间按权重公平分配
+
+    队列内按 priority 从高到低出队, 同优先级先进先出;
+    队列之间使用 stride 调度(加权公平队列的一种实现): 每个队列有一个虚拟时间 pass,
+    出队一个任务后增加 duration / 权重, 每次从 pass 最小的队列出队, 长期看各队列占用的
+    执行时间与权重成正比, 一个大批量的队列不会让其他队列饿死。
+    两层都是堆, 每次出队 O(log n)。
+    """
+
+    def __init__(self, weights: Optional[Dict[str, int]] = None, default_weight: int = 1):
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        # 队列名 -> [(-priority, 序号, task)], 只保存非空队列
+        self._queues: Dict[str, List[Tuple[int, int, Dict[str, Any]]]] = {}
+        # 非空队列的最小堆: (pass, 队列名)
+        self._active: List[Tuple[float, str]] = []
+        self._pass: Dict[str, float] = {}
+        # 最近一次出队的 pass; 重新变为非空的队列从这里开始, 空闲期间不累积份额
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def weight(self, queue: str) -> int:
+        return self.weights.get(queue, self.default_weight)
+
+    def queue_size(self, queue: str) -> int:
+        return len(self._queues.get(queue, ()))
+
+    def push(self, task: Dict[str, Any]):
+        """task 需包含 queue、priority、duration"""
+        queue = task['queue']
+        heap = self._queues.get(queue)
+        if heap is None:
+            heap = self._queues[queue] = []
+            self._pass[queue] = max(self._pass.get(queue, 0.0), self._vtime)
+            heapq.heappush(self._active, (self._pass[queue], queue))
+        heapq.heappush(heap, (-task['priority'], next(self._seq), task))
+        self._size += 1
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        if not self._active:
+            return None
+        current, queue = heapq.heappop(self._active)
+        heap = self._queues[queue]
+        task = heapq.heappop(heap)[2]
+        self._size -= 1
+        self._vtime = current
+        self._pass[queue] = current + task['duration'] / self.weight(queue)
+        if heap:
+            heapq.heappush(self._active, (self._pass[queue], queue))
+        else:
+            del self._queues[queue]
+        return task
+
+    def clear(self):
+        self._queues.clear()
+        self._active.clear()
+        self._size = 0
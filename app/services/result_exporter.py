@@ -0,0 +1,103 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from app.core.config import EXPORT_CHUNK_SIZE
+from app.core.pagination import encode_cursor, decode_cursor, keyset_after
+from app.core.serialization import dumps
+from app.models.models import Result
+
+CSV_COLUMNS = ["id", "task_id", "task_name", "created_at", "result_data", "cursor"]
+
+class ResultExporter:
+    """按 (created_at, id) 游标分块读取任务结果, 以 NDJSON 或 CSV 流式输出
+
+    每次只在内存中保留一个数据块; 每行都带有 cursor 字段, 中断后把最后收到的
+    cursor 传回即可从下一行继续导出。
+    """
+
+    def __init__(
+        self,
+        fmt: str = 'ndjson',
+        compress: bool = False,
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        task_prefix: Optional[str] = None,
+        chunk_size: int = EXPORT_CHUNK_SIZE
+    ):
+        if fmt not in ('ndjson', 'csv'):
+            raise ValueError("不支持的导出格式")
+        self.fmt = fmt
+        self.compress = compress
+        self.after = decode_cursor(cursor, datetime, int) if cursor else None
+        self.since = since
+        self.until = until
+        self.task_prefix = task_prefix
+        self.chunk_size = chunk_size
+
+    @property
+    def media_type(self) -> str:
+        return "application/x-ndjson" if self.fmt == 'ndjson' else "text/csv"
+
+    async def iter_chunks(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        query = Result.all()
+        if self.since:
+            query = query.filter(created_at__gte=self.since)
+        if self.until:
+            query = query.filter(created_at__lt=self.until)
+        if self.task_prefix:
+            query = query.filter(task__name__startswith=self.task_prefix)
+
+        after = self.after
+        while True:
+            chunk_query = query
+            if after:
+                created_at, last_id = after
+                chunk_query = chunk_query.filter(keyset_after('created_at', created_at, 'id', last_id))
+            rows = await chunk_query.order_by("created_at", "id").limit(self.chunk_size).values(
+                "id", "result_data", "created_at",
+                task_id="task__id",
+                task_name="task__name"
+            )
+            if not rows:
+                return
+            for row in rows:
+                row["cursor"] = encode_cursor(row["created_at"], row["id"])
+            yield rows
+            if len(rows) < self.chunk_size:
+                return
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+
+    def _format(self, rows: List[Dict[str, Any]]) -> str:
+        if self.fmt == 'ndjson':
+            return "".join(
+                dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n"
+                for row in rows
+            )
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                row["id"], row["task_id"], row["task_name"], row["created_at"].isoformat(),
+                dumps(row["result_data"]), row["cursor"]
+            ])
+        return buffer.getvalue()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        compressor = zlib.compressobj(wbits=31) if self.compress else None  # wbits=31: gzip 格式
+
+        def encode(text: str) -> bytes:
+            data = text.encode()
+            return compressor.compress(data) if compressor else data
+
+        if self.fmt == 'csv':
+            yield encode(",".join(CSV_COLUMNS) + "\r\n")
+        async for rows in self.iter_chunks():
+            data = encode(self._format(rows))
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
@@ -0,0 +1,51 @@
+from typing import Dict
+from tortoise.functions import Count
+from app.models.models import Task
+
+class TaskCounter:
+    """任务数量计数器
+
+    由新增、分配、完成、超时回收增量维护, 读取不访问数据库; 定期与数据库校准。
+    已预取到内存队列(status='queued')的任务计为待处理。
+    """
+
+    def __init__(self):
+        self.pending = 0
+        self.in_progress = 0
+        self.completed = 0
+
+    async def load(self, in_flight_completions: int = 0):
+        """从数据库重新统计, in_flight_completions 为已确认但尚未写回的完成数"""
+        rows = await Task.annotate(count=Count('id')).group_by('status').values('status', 'count')
+        counts = {row['status']: row['count'] for row in rows}
+        self.pending = counts.get('pending', 0) + counts.get('queued', 0)
+        self.in_progress = max(counts.get('in_progress', 0) - in_flight_completions, 0)
+        self.completed = counts.get('completed', 0) + in_flight_completions
+
+    def restore(self, counts: Dict[str, int]):
+        """使用其他节点校准后的结果(as_dict 的输出)"""
+        self.pending = counts['pending']
+        self.in_progress = counts['in_progress']
+        self.completed = counts['completed']
+
+    def tasks_added(self, count: int):
+        self.pending += count
+
+    def task_assigned(self):
+        self.pending -= 1
+        self.in_progress += 1
+
+    def task_completed(self):
+        self.in_progress -= 1
+        self.completed += 1
+
+    def tasks_requeued(self, count: int):
+        self.in_progress -= count
+        self.pending += count
+
+    def as_dict(self):
+        return {
+            "pending": self.pending,
+            "in_progress": self.in_progress,
+            "completed": self.completed
+        }
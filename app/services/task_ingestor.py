@@ -0,0 +1,194 @@
+import csv
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple, Union
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+from app.core.config import INGEST_CHUNK_SIZE, INGEST_MAX_ERRORS, INGEST_MAX_LINE_BYTES
+from app.core.database import get_connection, insert_ignore_sql, is_postgres
+from app.core.serialization import loads
+from app.models.models import Task
+from app.schemas.bulk import validate_tasks
+
+class TaskIngestor:
+    """流式导入任务
+
+    逐行解析 NDJSON 或 CSV(首行为表头, data 列为 JSON), 每 chunk_size 行批量校验、去重
+    并以忽略主键冲突的 INSERT 写入一次; 内存中只保留当前块, 与上传大小无关。
+    记录内不能包含换行符, 每行不超过 INGEST_MAX_LINE_BYTES 字节。inserted 为数据库实际插入的行数,
+    与并发导入冲突而跳过的行计入 duplicates。
+    """
+
+    def __init__(self, fmt: str = 'ndjson', chunk_size: int = INGEST_CHUNK_SIZE):
+        if fmt not in ('ndjson', 'csv'):
+            raise ValueError("不支持的导入格式")
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.summary: Dict[str, Any] = {
+            "rows": 0,
+            "inserted": 0,
+            "duplicates": 0,
+            "invalid": 0,
+            "errors": [],
+            "chunks": []
+        }
+        # 最近写入的一块任务所属的 (queue, requirements) 分组
+        self.groups: Set[Tuple[str, str]] = set()
+
+    async def ingest(self, stream: AsyncIterator[bytes]) -> Dict[str, Any]:
+        async for _ in self.iter_chunks(stream):
+            pass
+        return self.summary
+
+    async def iter_chunks(self, stream: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+        """逐块导入, 每写入一块产出该块的进度; 全部完成后 summary 为汇总结果"""
+        batch: List[Tuple[int, Any]] = []
+        async for row_index, record in self._iter_records(stream):
+            batch.append((row_index, record))
+            if len(batch) >= self.chunk_size:
+                yield await self._process_chunk(batch)
+                batch = []
+        if batch:
+            yield await self._process_chunk(batch)
+
+    async def _iter_lines(self, stream: AsyncIterator[bytes]) -> AsyncIterator[Union[str, ValueError]]:
+        """按行切分请求体并逐行解码, 不是有效 UTF-8 或过长的行以 ValueError 产出
+
+        按字节切分: UTF-8 多字节字符中不会出现换行符。超长的行不再缓存, 丢弃到下一个换行符为止。
+        """
+        buffer = b''
+        oversized = False
+        async for data in stream:
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield self._too_long() if oversized else self._decode(line)
+                oversized = False
+            if len(buffer) > INGEST_MAX_LINE_BYTES:
+                oversized = True
+                buffer = b''
+        if oversized:
+            yield self._too_long()
+        elif buffer:
+            yield self._decode(buffer)
+
+    @staticmethod
+    def _decode(line: bytes) -> Union[str, ValueError]:
+        if len(line) > INGEST_MAX_LINE_BYTES:
+            return TaskIngestor._too_long()
+        try:
+            return line.decode('utf-8')
+        except UnicodeDecodeError:
+            return ValueError("不是有效的 UTF-8 编码")
+
+    @staticmethod
+    def _too_long() -> ValueError:
+        return ValueError(f"单行超过 {INGEST_MAX_LINE_BYTES} 字节")
+
+    async def _iter_records(self, stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+        """产出 (行号, 原始记录), 行号从 0 开始且不含 CSV 表头; 无法解析的记录以异常对象产出"""
+        header = None
+        row_index = 0
+        async for line in self._iter_lines(stream):
+            if isinstance(line, ValueError):
+                yield row_index, line
+                row_index += 1
+                continue
+            line = line.rstrip('\r')
+            if not line.strip():
+                continue
+            if self.fmt == 'csv' and header is None:
+                header = next(csv.reader([line]))
+                continue
+            try:
+                yield row_index, self._parse(line, header)
+            except ValueError as e:
+                yield row_index, e
+            row_index += 1
+
+    def _parse(self, line: str, header: List[str]) -> Dict[str, Any]:
+        if self.fmt == 'ndjson':
+            record = loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("记录必须是 JSON 对象")
+            return record
+
+        values = next(csv.reader([line]))
+        if len(values) != len(header):
+            raise ValueError(f"列数应为 {len(header)}")
+        record = {key: value for key, value in zip(header, values) if value != ''}
+        if 'data' in record:
+            record['data'] = loads(record['data'])
+        return record
+
+    def _add_error(self, error: Dict[str, Any]):
+        if len(self.summary["errors"]) < INGEST_MAX_ERRORS:
+            self.summary["errors"].append(error)
+
+    async def _process_chunk(self, batch: List[Tuple[int, Any]]) -> Dict[str, Any]:
+        invalid = 0
+        parsed = []
+        for row_index, record in batch:
+            if isinstance(record, Exception):
+                invalid += 1
+                self._add_error({"row": row_index, "loc": [], "msg": str(record), "type": "value_error.parse"})
+            else:
+                parsed.append((row_index, record))
+
+        validated, errors = validate_tasks([record for _, record in parsed])
+        for error in errors:
+            self._add_error({**error, "row": parsed[error["row"]][0]})
+        tasks: Dict[str, Dict[str, Any]] = {}
+        for task in validated:
+            if task is None:
+                invalid += 1
+            else:
+                tasks.setdefault(task['id'], task)  # 块内重复的 id 只保留第一条
+
+        existing = set(await Task.filter(id__in=list(tasks)).values_list('id', flat=True)) if tasks else set()
+        new_tasks = [task for task_id, task in tasks.items() if task_id not in existing]
+        inserted = await self._insert(new_tasks) if new_tasks else 0
+        self.groups = {(task['queue'], Task.requirements_of(task['data'])) for task in new_tasks}
+
+        duplicates = len(batch) - invalid - inserted
+        self.summary["rows"] += len(batch)
+        self.summary["invalid"] += invalid
+        self.summary["inserted"] += inserted
+        self.summary["duplicates"] += duplicates
+        progress = {
+            "chunk": len(self.summary["chunks"]),
+            "rows": len(batch),
+            "inserted": inserted,
+            "duplicates": duplicates,
+            "invalid": invalid
+        }
+        self.summary["chunks"].append(progress)
+        return progress
+
+    async def _insert(self, tasks: List[Dict[str, Any]]) -> int:
+        """忽略主键冲突的 INSERT, 返回实际插入的行数: 与并发导入冲突的 id 直接跳过"""
+        data_field = Task._meta.fields_map['data']
+        created_at = Task._meta.fields_map['created_at'].to_db_value(timezone.now(), Task)
+        columns = ['id', 'name', 'duration', 'reward', 'priority', 'queue', 'requirements', 'status', 'data', 'created_at']
+        placeholders = "(?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?)"
+        rows = [
+            [task['id'], task['name'], task['duration'], task['reward'], task['priority'], task['queue'],
+             Task.requirements_of(task['data']), data_field.to_db_value(task['data'], Task), created_at]
+            for task in tasks
+        ]
+        connection = get_connection()
+        if is_postgres(connection):
+            # 一条多行 INSERT, RETURNING 只返回真正插入的行
+            _, inserted = await connection.execute_query(
+                insert_ignore_sql(connection, 'task', columns, ', '.join([placeholders] * len(rows))) + " RETURNING id",
+                [value for row in rows for value in row]
+            )
+            return len(inserted)
+        # SQLite: 事务期间独占连接, 前后 total_changes() 的差值即本次插入的行数
+        async with in_transaction() as transaction:
+            before = await self._total_changes(transaction)
+            await transaction.execute_many(insert_ignore_sql(transaction, 'task', columns, placeholders), rows)
+            return await self._total_changes(transaction) - before
+
+    @staticmethod
+    async def _total_changes(connection) -> int:
+        _, rows = await connection.execute_query("SELECT total_changes() AS changes")
+        return rows[0]['changes']
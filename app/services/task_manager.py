@@ -1,21 +1,172 @@
+import asyncio
+import heapq
+import logging
 import random
+import time
 import uuid
-from datetime import datetime
-from typing import Dict, Any
-from fastapi import WebSocket
-import json
-from app.models.models import Task, User, Result
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Callable, Collection, Dict, Any, FrozenSet, List, Optional, Set, Tuple
+from tortoise import timezone
+from tortoise.query_utils import Q
+from app.core.config import (
+    TASK_PREFETCH_BATCH_SIZE, TASK_RESCAN_INTERVAL, LEASE_FLUSH_INTERVAL, TASK_TIMEOUT_GRACE, DB_IN_CHUNK_SIZE,
+    NODE_ID, TASK_PREFETCH_MIN_PER_QUEUE, TASK_QUEUE_WEIGHTS, TASK_QUEUE_DEFAULT_WEIGHT
+)
+from app.core.database import get_connection, is_postgres, format_sql
+from app.models.models import Task
+from app.services.task_counter import TaskCounter
+from app.services.client_connection import ClientConnection
+from app.services.ready_queues import ReadyQueues
+from app.services.worker_stats import WorkerStats
+from app.services.user_cache import UserCache
+
+logger = logging.getLogger(__name__)
 
 class TaskManager:
-    def __init__(self):
-        self.clients: Dict[str, WebSocket] = {}
-        self.client_states: Dict[str, str] = {}  # 新增客户端状态字典
+    def __init__(self, user_cache: Optional[UserCache] = None):
+        self.clients: Dict[str, ClientConnection] = {}
+        # 还能接收任务(持有的任务数少于预取窗口)的客户端, 按变为空闲的先后排序(作为有序集合使用, 值恒为 None)
+        self.idle_clients: 'OrderedDict[str, None]' = OrderedDict()
+        # 持有任务的客户端 -> 租给它的任务ID
+        self.busy_clients: Dict[str, Set[str]] = {}
+        # 客户端的预取窗口: 同时租给它的任务数上限
+        self.client_windows: Dict[str, int] = {}
+        # 客户端声明的能力, 如 {'elements', 'ocr'}
+        self.client_capabilities: Dict[str, FrozenSet[str]] = {}
+        # 出现过的能力要求: requirements 字符串 -> 能力集合, '' 表示没有要求
+        self._requirement_sets: Dict[str, FrozenSet[str]] = {'': frozenset()}
+        # 能力要求 -> 能执行它的空闲客户端(有序集合), '' 对应 idle_clients 本身;
+        # 客户端变为空闲/忙碌时按它满足的每个能力要求更新, 为任务找可用客户端时直接取队首
+        self.idle_index: Dict[str, 'OrderedDict[str, None]'] = {'': self.idle_clients}
+        # 用户信息缓存, 已确认的完成会立即计入其中的积分, 不等待数据库写回
+        self.user_cache = user_cache or UserCache()
+        # 已从数据库认领(status='queued')、等待分配的任务: 能力要求 -> 按队列和优先级组织的就绪任务
+        self.ready: Dict[str, ReadyQueues] = {}
+        # 上次预取取满了一批、数据库中可能还有任务的分组 (queue, requirements)
+        self._more_queues: Set[Tuple[str, str]] = set()
+        # 上述分组中内存部分已分配完、需要再次预取的分组
+        self._drained_queues: Set[Tuple[str, str]] = set()
+        # 新增或回收了任务、下次预取时需要认领的分组
+        self._pending_groups: Set[Tuple[str, str]] = set()
+        # 有分组未知的新任务(启动、失效节点的任务被回收)时置位, 下次预取查询数据库中有哪些分组
+        self._rescan = True
+        # 已分配给客户端的任务租约: task_id -> {client_id, reward, duration, started_at, deadline, group}
+        self.leases: Dict[str, Dict[str, Any]] = {}
+        # 租约到期时间最小堆: (deadline, task_id), 租约结束后惰性删除
+        self._deadlines: List[Tuple[float, str]] = []
+        # 尚未写回数据库的租约
+        self._unflushed_leases: List[Dict[str, Any]] = []
+        # 已到期、任务还未放回待处理状态的租约
+        self._unrequeued_leases: List[Dict[str, Any]] = []
+        self._refill_lock = asyncio.Lock()
+        self.counter = TaskCounter()
+        self.stats = WorkerStats()
+        # 兜底的分组查询最早在这个时刻(time.monotonic)再执行
+        self._next_rescan = 0.0
+        # 集群模式下其他节点上的在线客户端数, 由 Cluster 根据心跳更新
+        self.remote_client_count = 0
+        # 发往不在本节点的客户端的消息交给它转发(由 Cluster 设置), 返回是否已接收
+        self.router: Optional[Callable[[str, Dict], bool]] = None
+
+    def add_client(self, client_id: str, connection: ClientConnection, window: int = 1,
+                   capabilities: FrozenSet[str] = frozenset()):
+        self.clients[client_id] = connection
+        self.client_windows[client_id] = window
+        self._set_idle(client_id, False)
+        self.client_capabilities[client_id] = capabilities
+        # 重连的客户端仍持有之前的租约(由 resume_leases 重发), 只有窗口未满时才是空闲状态
+        if self.free_slots(client_id) > 0:
+            self._set_idle(client_id, True)
+
+    def remove_client(self, client_id: str):
+        """客户端断开; 它持有的租约保留到完成或到期, 重连后可以继续执行"""
+        self._set_idle(client_id, False)
+        self.clients.pop(client_id, None)
+        self.client_windows.pop(client_id, None)
+        self.client_capabilities.pop(client_id, None)
+
+    def mark_busy(self, client_id: str, task_id: str):
+        tasks = self.busy_clients.setdefault(client_id, set())
+        tasks.add(task_id)
+        if len(tasks) >= self.client_windows.get(client_id, 1):
+            self._set_idle(client_id, False)
+
+    def mark_idle(self, client_id: str, task_id: str):
+        """客户端完成或失去一个任务, 腾出一个窗口位置"""
+        tasks = self.busy_clients.get(client_id)
+        if tasks is not None:
+            tasks.discard(task_id)
+            if not tasks:
+                del self.busy_clients[client_id]
+        # 以更小的窗口重连的客户端持有的租约可能仍多于窗口
+        if client_id in self.clients and client_id not in self.idle_clients and self.free_slots(client_id) > 0:
+            self._set_idle(client_id, True)
+
+    def _eligible_requirements(self, client_id: str) -> List[str]:
+        """客户端能满足的能力要求"""
+        capabilities = self.client_capabilities.get(client_id, frozenset())
+        return [key for key, required in self._requirement_sets.items() if required <= capabilities]
+
+    def _set_idle(self, client_id: str, idle: bool):
+        """同步更新 idle_clients 和各能力要求的空闲索引"""
+        for key in self._eligible_requirements(client_id):
+            if idle:
+                self.idle_index[key][client_id] = None
+            else:
+                self.idle_index[key].pop(client_id, None)
+
+    def _register_requirements(self, key: str):
+        """第一次遇到某个能力要求时, 从当前空闲客户端建立它的空闲索引"""
+        if key in self._requirement_sets:
+            return
+        required = frozenset(key.split(','))
+        self._requirement_sets[key] = required
+        self.idle_index[key] = OrderedDict(
+            (client_id, None) for client_id in self.idle_clients
+            if required <= self.client_capabilities.get(client_id, frozenset())
+        )
+
+    def is_idle(self, client_id: str) -> bool:
+        """还能接收任务"""
+        return client_id in self.idle_clients
+
+    def free_slots(self, client_id: str) -> int:
+        return self.client_windows.get(client_id, 1) - len(self.busy_clients.get(client_id, ()))
+
+    @property
+    def idle_count(self) -> int:
+        return len(self.idle_clients)
+
+    @property
+    def busy_count(self) -> int:
+        return len(self.busy_clients)
 
     def get_idle_clients(self):
-        return [
-            client_id for client_id in self.clients 
-            if self.client_states.get(client_id) != 'busy'
-        ]
+        return list(self.idle_clients)
+
+    @property
+    def ready_count(self) -> int:
+        return sum(len(ready) for ready in self.ready.values())
+
+    def ready_requirements(self) -> List[str]:
+        """有就绪任务的能力要求, 要求多的在前: 能执行它们的客户端更少, 先为它们匹配"""
+        return sorted(
+            (key for key, ready in self.ready.items() if ready),
+            key=lambda key: -len(self._requirement_sets[key])
+        )
+
+    def outstanding_seconds(self, client_id: str) -> int:
+        """客户端手上租约的 duration 之和"""
+        return sum(self.leases[task_id]['duration'] for task_id in self.busy_clients.get(client_id, ()))
+
+    def expected_completion(self, client_id: str) -> float:
+        """客户端再接一个任务预计多久能成功完成, 分发时据此在候选客户端中选择"""
+        return self.stats.expected_completion(client_id, self.outstanding_seconds(client_id))
+
+    def get_online_count(self) -> int:
+        """集群内的在线客户端总数"""
+        return len(self.clients) + self.remote_client_count
 
     async def generate_tasks(self, count=1000):
         new_tasks = [{
@@ -28,77 +179,389 @@ class TaskManager:
         await Task.bulk_create([
             Task(**task) for task in new_tasks
         ])
+        self.counter.tasks_added(count)
+        self.notify_tasks_available([('default', '')])
 
-    async def get_pending_tasks_count(self):
-        return await Task.filter(status='pending').count()
+    def get_pending_tasks_count(self) -> int:
+        # 读取计数器, 已预取到内存队列中的任务对外仍视为待处理
+        return self.counter.pending
 
     async def get_total_tasks_count(self):
         return await Task.all().count()
 
-    async def assign_task(self, client_id: str) -> bool:
-        task = await Task.filter(status='pending').first().select_for_update()
-        if task:
-            task.status = 'in_progress'
-            task.client_id = client_id
-            task.started_at = datetime.now()
-            await task.save()
-            
-            # 设置客户端状态为忙碌
-            self.client_states[client_id] = 'busy'
-            
-            await self.send_to_client(client_id, {
-                "event": "new_task",
-                "data": {
-                    "id": task.id,
-                    "name": task.name,
-                    "data": task.data,
-                    "duration": task.duration,
-                    "reward": task.reward
-                }
+    async def recover(self, live_nodes: Collection[str] = ()):
+        """启动时将本节点上次运行预取但未分配的任务放回待处理状态, 并接管失效节点持有的租约
+
+        live_nodes 为当前存活的节点, 它们持有的租约(客户端可能只是暂时断开)不载入。
+        接管用一条条件 UPDATE 完成: 同时启动的两个节点都先登记再读取存活节点, 后读取的一方能看到先登记的一方,
+        不会接管同一个租约。
+        """
+        self.ready.clear()
+        self._more_queues.clear()
+        self._drained_queues.clear()
+        self._pending_groups.clear()
+        self._rescan = True
+        await Task.filter(status='queued', client_id=NODE_ID).update(status='pending', client_id=None)
+        await Task.filter(
+            Q(node_id__isnull=True) | ~Q(node_id__in=list({*live_nodes, NODE_ID})), status='in_progress'
+        ).update(node_id=NODE_ID)
+        rows = await Task.filter(status='in_progress', node_id=NODE_ID).values(
+            'id', 'client_id', 'reward', 'duration', 'started_at', 'queue', 'requirements'
+        )
+        for row in rows:
+            self.busy_clients.setdefault(row['client_id'], set()).add(row['id'])
+            self._add_lease({
+                "task_id": row['id'],
+                "client_id": row['client_id'],
+                "reward": row['reward'],
+                "duration": row['duration'],
+                "started_at": row['started_at'] or timezone.now(),
+                "group": (row['queue'], row['requirements'])
             })
-            return True
-        return False
 
-    async def complete_task(self, task_id: str, result_data: Any):
-        task = await Task.get(id=task_id)
-        task.status = 'completed'
-        task.completed_at = datetime.now()
-        await task.save()
-        
-        await Result.create(task=task, result_data={'data': result_data})
-        
-        user, _ = await User.get_or_create(id=task.client_id)
-        user.points += task.reward
-        await user.save()
-        
-        # 重置客户端状态为空闲
-        self.client_states[task.client_id] = 'idle'
-        
-        return user.points
+    def notify_tasks_available(self, groups: Optional[Collection[Tuple[str, str]]] = None):
+        """有新的待处理任务(新增或超时回收)时调用
 
-    async def send_to_client(self, client_id: str, message: Dict):
-        if client_id in self.clients:
-            await self.clients[client_id].send_text(json.dumps(message))
+        groups 为这些任务所属的 (queue, requirements) 分组, 下次预取只认领这些分组;
+        不知道分组时传 None, 下次预取查询数据库中有哪些分组。
+        """
+        if groups is None:
+            self._rescan = True
+        else:
+            self._pending_groups.update(groups)
+
+    async def refill_pending_queue(self) -> int:
+        """从数据库预取待处理任务, 返回内存中的就绪任务数
+
+        按 (queue, requirements) 分组各自认领一批(按优先级从高到低), 大批量的队列不会占满预取额度,
+        暂时没有客户端能执行的任务也不会挡住其他任务; 内存中已有就绪任务的分组暂不预取, 用完后再单独补充。
+        需要预取的分组来自新增/回收任务时的通知和内存中用完的分组, 只在启动、收到分组未知的通知,
+        或者没有任何任务可分配时(最多每 TASK_RESCAN_INTERVAL 秒一次)才用 SELECT DISTINCT 查询数据库。
+        """
+        async with self._refill_lock:
+            groups = self._pending_groups | self._drained_queues
+            self._pending_groups.clear()
+            self._drained_queues.clear()
+            now = time.monotonic()
+            if self._rescan or (not groups and not self.ready_count and now >= self._next_rescan):
+                self._rescan = False
+                self._next_rescan = now + TASK_RESCAN_INTERVAL
+                groups.update(await Task.filter(status='pending').distinct().values_list('queue', 'requirements'))
+
+            claim = []
+            for group in groups:
+                queue, requirements = group
+                if requirements in self.ready and self.ready[requirements].queue_size(queue):
+                    # 内存中还有这个分组的任务, 用完后再补充
+                    self._more_queues.add(group)
+                else:
+                    claim.append(group)
+
+            if claim:
+                connection = get_connection()
+                limit = max(TASK_PREFETCH_BATCH_SIZE // len(claim), TASK_PREFETCH_MIN_PER_QUEUE)
+                for group in claim:
+                    if is_postgres(connection):
+                        rows = await self._claim_skip_locked(connection, *group, limit)
+                    else:
+                        rows = await self._claim(*group, limit)
+                    if len(rows) < limit:
+                        self._more_queues.discard(group)
+                    else:
+                        self._more_queues.add(group)
+                    if rows:
+                        ready = self._ready_for(group[1])
+                        for row in rows:
+                            row['requirements'] = group[1]
+                            ready.push(row)
+            return self.ready_count
 
-    async def try_assign_tasks(self):
-        """尝试为所有空闲客户端分配任务"""
-        idle_clients = self.get_idle_clients()
-        assigned_count = 0
+    async def ensure_ready(self):
+        """内存中没有就绪任务、有分组需要补充或有新任务时预取"""
+        if not self.ready_count or self._drained_queues or self._pending_groups or self._rescan:
+            await self.refill_pending_queue()
+
+    def _ready_for(self, requirements: str) -> ReadyQueues:
+        if requirements not in self.ready:
+            self._register_requirements(requirements)
+            self.ready[requirements] = ReadyQueues(TASK_QUEUE_WEIGHTS, TASK_QUEUE_DEFAULT_WEIGHT)
+        return self.ready[requirements]
+
+    async def _claim(self, queue: str, requirements: str, limit: int) -> List[Dict[str, Any]]:
+        """SQLite: 写操作本身串行, 先查后按 status 条件认领即可"""
+        rows = await Task.filter(status='pending', queue=queue, requirements=requirements).order_by(
+            '-priority', 'created_at'
+        ).limit(limit).values('id', 'name', 'data', 'duration', 'reward', 'priority', 'queue')
+        if not rows:
+            return rows
+        ids = [row['id'] for row in rows]
+        claimed = await Task.filter(id__in=ids, status='pending').update(status='queued', client_id=NODE_ID)
+        if claimed < len(rows):
+            # 部分任务已被共用数据库的其他进程认领
+            mine = set(await Task.filter(id__in=ids, status='queued', client_id=NODE_ID).values_list('id', flat=True))
+            rows = [row for row in rows if row['id'] in mine]
+        return rows
+
+    async def _claim_skip_locked(self, connection, queue: str, requirements: str, limit: int) -> List[Dict[str, Any]]:
+        """PostgreSQL: 一条语句完成选取和认领, 多个进程并发预取时跳过彼此锁定的行
+
+        使用 execute_query_dict: execute_query 对以 UPDATE 开头的语句只返回影响行数, 会丢掉 RETURNING 的行。
+        """
+        rows = await connection.execute_query_dict(format_sql(
+            connection,
+            "UPDATE task SET status='queued', client_id=? WHERE id IN ("
+            "SELECT id FROM task WHERE status='pending' AND queue=? AND requirements=? "
+            "ORDER BY priority DESC, created_at LIMIT ? FOR UPDATE SKIP LOCKED"
+            ") RETURNING id, name, data, duration, reward, priority, queue, created_at"
+        ), [NODE_ID, queue, requirements, limit])
+        data_field = Task._meta.fields_map['data']
+        # RETURNING 不保证顺序, 按优先级和创建时间重新排序
+        return [
+            {
+                "id": row['id'],
+                "name": row['name'],
+                "data": data_field.to_python_value(row['data']),
+                "duration": row['duration'],
+                "reward": row['reward'],
+                "priority": row['priority'],
+                "queue": row['queue']
+            }
+            for row in sorted(rows, key=lambda row: (-row['priority'], row['created_at']))
+        ]
+
+    def _pop_for(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """从客户端能执行的就绪任务中取一个, 优先要求最多的分组"""
+        best = None
+        for key in self._eligible_requirements(client_id):
+            if self.ready.get(key) and (best is None or len(self._requirement_sets[key]) > len(self._requirement_sets[best])):
+                best = key
+        if best is None:
+            return None
+        task = self.ready[best].pop()
+        group = (task['queue'], best)
+        if group in self._more_queues and not self.ready[best].queue_size(task['queue']):
+            self._drained_queues.add(group)
+        return task
+
+    async def flush_leases(self):
+        """将内存中的任务租约批量写回数据库"""
+        if not self._unflushed_leases:
+            return
+        leases, self._unflushed_leases = self._unflushed_leases, []
+        started_at_field = Task._meta.fields_map['started_at']
+        connection = get_connection()
+        try:
+            await connection.execute_many(
+                format_sql(
+                    connection,
+                    "UPDATE task SET status='in_progress', client_id=?, started_at=?, node_id=? "
+                    "WHERE id=? AND status='queued'"
+                ),
+                [
+                    [
+                        lease['client_id'], started_at_field.to_db_value(lease['started_at'], Task), NODE_ID,
+                        lease['task_id']
+                    ]
+                    for lease in leases if not lease.get('expired')
+                ]
+            )
+        except Exception:
+            # 写回失败的租约放回, 下次重试; 否则任务行一直停留在 queued, 完成时 client_id 还是节点ID
+            self._unflushed_leases = leases + self._unflushed_leases
+            raise
+
+    async def lease_writer(self):
+        """定期写回任务租约"""
+        while True:
+            await asyncio.sleep(LEASE_FLUSH_INTERVAL)
+            try:
+                await self.flush_leases()
+            except Exception:
+                logger.exception("任务租约写回失败")
+
+    def _add_lease(self, lease: Dict[str, Any]):
+        """登记租约, 到期时间为 started_at + duration + 宽限时间"""
+        lease['deadline'] = lease['started_at'].timestamp() + lease['duration'] + TASK_TIMEOUT_GRACE
+        self.leases[lease['task_id']] = lease
+        heapq.heappush(self._deadlines, (lease['deadline'], lease['task_id']))
+
+    def expire_leases(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """弹出所有已到期的租约, 并把持有它们的客户端置为空闲"""
+        now = time.time() if now is None else now
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, task_id = heapq.heappop(self._deadlines)
+            lease = self.leases.get(task_id)
+            if lease is None or lease['deadline'] != deadline:
+                continue  # 租约已结束
+            del self.leases[task_id]
+            lease['expired'] = True  # 尚未写回的租约不再写回
+            expired.append(lease)
+            self.stats.task_timed_out(lease['client_id'])
+            if task_id in self.busy_clients.get(lease['client_id'], ()):
+                self.mark_idle(lease['client_id'], task_id)
+        return expired
+
+    async def requeue_expired(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """弹出到期的租约并把任务放回待处理状态, 返回这些租约
+
+        放回失败时未完成的部分保留下来, 下次调用时重试; 否则任务行会一直停留在执行中。
+        """
+        self._unrequeued_leases.extend(self.expire_leases(now))
+        requeued = []
+        while self._unrequeued_leases:
+            leases = self._unrequeued_leases[:DB_IN_CHUNK_SIZE]
+            await self.requeue_tasks([lease['task_id'] for lease in leases])
+            del self._unrequeued_leases[:len(leases)]
+            requeued.extend(leases)
+        return requeued
+
+    async def requeue_tasks(self, task_ids: List[str]) -> int:
+        """用批量 UPDATE 把超时任务放回待处理状态, 返回实际放回的数量"""
+        requeued = 0
+        for i in range(0, len(task_ids), DB_IN_CHUNK_SIZE):
+            requeued += await Task.filter(
+                id__in=task_ids[i:i + DB_IN_CHUNK_SIZE],
+                status__in=['queued', 'in_progress']
+            ).update(status='pending', client_id=None, started_at=None, node_id=None)
+        return requeued
+
+    async def release_orphaned_claims(self, live_nodes: Collection[str]) -> int:
+        """把已失效节点预取但未分配的任务放回待处理状态"""
+        return await Task.filter(
+            Q(client_id__isnull=True) | ~Q(client_id__in=list(live_nodes)), status='queued'
+        ).update(status='pending', client_id=None)
+
+    async def requeue_orphaned_leases(self, grace: float, live_nodes: Collection[str]) -> int:
+        """把已失效节点持有、超过到期时间 grace 秒仍为执行中的任务放回待处理状态
+
+        存活节点的租约由它自己到期回收; 失效节点的租约可能已被新启动的节点接管, 多等 grace 秒再回收。
+        """
+        cutoff = time.time() - TASK_TIMEOUT_GRACE - grace
+        rows = await Task.filter(
+            Q(node_id__isnull=True) | ~Q(node_id__in=list(live_nodes)), status='in_progress'
+        ).values('id', 'duration', 'started_at')
+        orphaned = [
+            row['id'] for row in rows
+            if row['id'] not in self.leases
+            and row['started_at'] and row['started_at'].timestamp() + row['duration'] <= cutoff
+        ]
+        if not orphaned:
+            return 0
+        return await self.requeue_tasks(orphaned)
+
+    async def assign_tasks(self, client_id: str) -> int:
+        """按客户端剩余的窗口位置分配它能执行的任务, 一次发送; 返回分配的任务数"""
+        tasks = []
+        for _ in range(self.free_slots(client_id)):
+            await self.ensure_ready()
+            task = self._pop_for(client_id)
+            if task is None:
+                break
+            tasks.append(task)
+        if not tasks:
+            return 0
+
+        # 客户端按顺序执行窗口内的任务, 排在后面的任务以预计开始时间作为 started_at, 到期时间随之顺延
+        # 使用带时区的时间: 写入的无时区时间读回时会被当作 UTC, 到期时间会相差一个时区偏移
+        wait = self.outstanding_seconds(client_id)
+        now = timezone.now()
+        assigned_at = time.time()
+        payloads = []
+        for task in tasks:
+            payload = {
+                "id": task['id'],
+                "name": task['name'],
+                "data": task['data'],
+                "duration": task['duration'],
+                "reward": task['reward']
+            }
+            payloads.append(payload)
+            lease = {
+                "task_id": task['id'],
+                "client_id": client_id,
+                "reward": task['reward'],
+                "duration": task['duration'],
+                "started_at": now + timedelta(seconds=wait),
+                "assigned_at": assigned_at,
+                # 超时回收后通知预取这个分组
+                "group": (task['queue'], task['requirements']),
+                # 客户端重连时重发
+                "payload": payload
+            }
+            wait += task['duration']
+            self._add_lease(lease)
+            self._unflushed_leases.append(lease)
+            self.counter.task_assigned()
+            self.stats.task_assigned(client_id, task['duration'])
+            self.mark_busy(client_id, task['id'])
+
+        self._send_tasks(client_id, payloads)
+        return len(tasks)
+
+    def _send_tasks(self, client_id: str, payloads: List[Dict[str, Any]]):
+        # 窗口为 1 的客户端保持逐条的 new_task 消息
+        if self.client_windows.get(client_id, 1) == 1:
+            for payload in payloads:
+                self.send_to_client(client_id, {"event": "new_task", "data": payload})
+        else:
+            self.send_to_client(client_id, {"event": "new_tasks", "data": payloads})
+
+    async def resume_leases(self, client_id: str) -> int:
+        """客户端重连后重新发送它仍持有的租约任务, 返回重发的任务数
+
+        这些任务占用的窗口位置不会再分配新任务; 到期时间不变, 重连不能延长租约。
+        启动时从数据库载入的租约没有任务内容, 重发前查询一次。
+        """
+        task_ids = [task_id for task_id in self.busy_clients.get(client_id, ()) if task_id in self.leases]
+        if not task_ids:
+            return 0
+        missing = [task_id for task_id in task_ids if 'payload' not in self.leases[task_id]]
+        if missing:
+            rows = await Task.filter(id__in=missing).values('id', 'name', 'data', 'duration', 'reward')
+            for row in rows:
+                if row['id'] in self.leases:
+                    self.leases[row['id']]['payload'] = row
+        # 查询期间租约可能已完成或到期
+        leases = sorted(
+            (self.leases[task_id] for task_id in task_ids if 'payload' in self.leases.get(task_id, {})),
+            key=lambda lease: lease['started_at']
+        )
+        if leases:
+            self._send_tasks(client_id, [lease['payload'] for lease in leases])
+        return len(leases)
+
+    async def complete_task(self, task_id: str, result_data: Any, client_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """在内存中结束任务租约并返回完成记录, 数据库写回由 CompletionPipeline 批量完成
+
+        任务没有有效租约(重复提交或已超时回收), 或提交者不是租约持有者(指定 client_id 时)时返回 None。
+        """
+        lease = self.leases.get(task_id)
+        if lease is None or (client_id is not None and lease['client_id'] != client_id):
+            if client_id is not None:
+                self.stats.task_rejected(client_id)
+            return None
+        del self.leases[task_id]
+        self.stats.task_completed(lease['client_id'], lease)
+
+        client_id = lease['client_id']
+        self.user_cache.add_points(client_id, lease['reward'])
         
-        for client_id in idle_clients:
-            assigned = await self.assign_task(client_id)
-            if assigned:
-                assigned_count += 1
-            else:
-                await self.send_to_client(client_id, {"event": "waiting"})
+        # 腾出客户端的窗口位置
+        self.mark_idle(client_id, task_id)
+        self.counter.task_completed()
         
-        return assigned_count
-
-    async def try_assign_task(self, client_id: str):
-        """尝试为单个客户端分配任务"""
-        if client_id in self.get_idle_clients():
-            assigned = await self.assign_task(client_id)
-            if not assigned:
-                await self.send_to_client(client_id, {"event": "waiting"})
-            return assigned
-        return False 
\ No newline at end of file
+        return {
+            "task_id": task_id,
+            "client_id": client_id,
+            "reward": lease['reward'],
+            "result": result_data
+        }
+
+    def send_to_client(self, client_id: str, message: Dict) -> bool:
+        """放入客户端的发送队列, 不等待网络 I/O; 客户端连接在其他节点时经 router 转发"""
+        if client_id in self.clients:
+            return self.clients[client_id].send(message)
+        if self.router:
+            return self.router(client_id, message)
+        return False
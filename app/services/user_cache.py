@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import USER_CACHE_TTL, USER_CACHE_SIZE
+from app.models.models import User
+
+class UserCache:
+    """按 client_id 缓存用户信息(username、points、created_at), 供 /user、WebSocket 握手和任务完成共用
+
+    离线用户的缓存项按 TTL 过期, 超过 USER_CACHE_SIZE 时淘汰最久未使用的; 不存在的 client_id 也缓存,
+    重连风暴中无效的 ID 不会反复查库。在线客户端的缓存项被固定(pin), 断开前不过期也不淘汰。
+    积分变动(任务完成、提现)直接更新缓存中的值: 完成记录是异步写回的, 重新查库反而会读到偏小的积分。
+    其他节点上的积分变动经 Cluster 同步过来, 客户端在节点间切换后各节点缓存的积分保持一致。
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        # client_id -> (过期时间, 用户信息或 None), 按最近使用排序
+        self._entries: 'OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]' = OrderedDict()
+        # 在线客户端的用户信息
+        self._online: Dict[str, Dict[str, Any]] = {}
+
+    async def get(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """返回用户信息, 用户不存在时返回 None; 未命中时查询一次数据库"""
+        user = self._online.get(client_id)
+        if user is not None:
+            return user
+        entry = self._entries.get(client_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(client_id)
+            return entry[1]
+
+        rows = await User.filter(id=client_id).values('username', 'points', 'created_at')
+        user = rows[0] if rows else None
+        self._store(client_id, user)
+        return user
+
+    def _store(self, client_id: str, user: Optional[Dict[str, Any]]):
+        self._entries[client_id] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(client_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pin(self, client_id: str, user: Dict[str, Any]):
+        """客户端连接后固定它的缓存项"""
+        self._entries.pop(client_id, None)
+        self._online[client_id] = user
+
+    def unpin(self, client_id: str):
+        """客户端断开后转为普通缓存项, 按 TTL 过期"""
+        user = self._online.pop(client_id, None)
+        if user is not None:
+            self._store(client_id, user)
+
+    def points(self, client_id: str) -> Optional[int]:
+        user = self._online.get(client_id)
+        if user is None:
+            entry = self._entries.get(client_id)
+            user = entry[1] if entry else None
+        return user['points'] if user else None
+
+    def add_points(self, client_id: str, delta: int):
+        """积分变动后更新缓存中的值, 没有缓存时不处理"""
+        user = self._online.get(client_id)
+        if user is None:
+            entry = self._entries.get(client_id)
+            user = entry[1] if entry else None
+        if user is not None:
+            user['points'] += delta
@@ -1,83 +1,168 @@
 from fastapi import WebSocket, WebSocketDisconnect
-import json
-from datetime import datetime, timedelta
 import asyncio
+import logging
 
-from app.models.models import Task, User
-from app.core.instances import task_manager, connection_manager
+from app.core.config import (
+    TASK_COUNT_RECONCILE_INTERVAL, TASK_REAPER_INTERVAL, CLUSTER_REAPER_INTERVAL, CLUSTER_ORPHAN_GRACE,
+    TASK_PREFETCH_WINDOW_MAX, WS_ADMISSION_MAX_WAIT
+)
+from app.core.protocol import JSON_PROTOCOL, get_protocol
+from app.core.instances import (
+    task_manager, connection_manager, completion_pipeline, dispatcher, broadcaster, cluster, user_cache, admission
+)
+
+logger = logging.getLogger(__name__)
 
 class WebSocketService:
     @staticmethod
-    async def handle_connection(websocket: WebSocket, client_id: str):
-        """处理新的WebSocket连接"""
-        # 验证客户端ID是否存在
-        if not await User.exists(id=client_id):
+    async def handle_connection(websocket: WebSocket, client_id: str, prefetch: int = 1, capabilities: str = '',
+                                protocol: str = 'json', batch: bool = False):
+        """处理新的WebSocket连接
+
+        prefetch 为客户端希望同时持有的任务数, capabilities 为逗号分隔的能力列表,
+        protocol 为消息编码: json(默认, 文本帧) 或 msgpack(二进制帧), batch 为真时合并发送多条消息。
+        """
+        # 准入控制: 大量客户端同时重连时按令牌桶匀速放行, 排队过久的稍后重试
+        if not await admission.acquire(WS_ADMISSION_MAX_WAIT):
+            await websocket.close(code=1013)
+            return
+        # 验证客户端ID是否存在; 用户信息经缓存读取, 握手最多查询一次数据库
+        user = await user_cache.get(client_id)
+        if user is None:
             await websocket.close(code=1008)
             return
-        
-        await connection_manager.connect(websocket, client_id)
+        codec = get_protocol(protocol)
+        if codec is None:
+            await websocket.close(code=1003)
+            return
+
+        window = min(max(prefetch, 1), TASK_PREFETCH_WINDOW_MAX)
+        capability_set = frozenset(item.strip() for item in capabilities.split(',') if item.strip())
+        receive = websocket.receive_bytes if codec.binary else websocket.receive_text
+        connection = None
         try:
+            connection = await connection_manager.connect(
+                websocket, client_id, user, window, capability_set, codec, batch
+            )
             while True:
-                data = await websocket.receive_text()
-                await WebSocketService.handle_message(websocket, client_id, data)
+                data = await receive()
+                await WebSocketService.handle_message(websocket, client_id, data, codec)
         except WebSocketDisconnect:
-            connection_manager.disconnect(client_id)
+            pass
+        finally:
+            # connect 失败时已自行撤销登记
+            if connection is not None:
+                connection_manager.disconnect(client_id, connection)
 
     @staticmethod
-    async def handle_message(websocket: WebSocket, client_id: str, data: str):
-        """处理WebSocket消息"""
-        message = json.loads(data)
-        
-        if message["event"] == "task_complete":
-            await WebSocketService.handle_task_complete(
-                websocket, 
-                client_id,
-                message["data"]["task_id"],
-                message["data"]["result"]
-            )
+    async def handle_message(websocket: WebSocket, client_id: str, data, protocol=JSON_PROTOCOL):
+        """按连接的协议解码WebSocket消息, 经 MESSAGE_HANDLERS 分发给对应的处理函数"""
+        message = protocol.decode(data)
+        handler = MESSAGE_HANDLERS.get(message.get("event"))
+        if handler:
+            await handler(websocket, client_id, message["data"])
 
     @staticmethod
     async def handle_task_complete(websocket: WebSocket, client_id: str, task_id: str, result: str):
         """处理任务完成事件"""
-        # 更新任务状态和用户积分
-        new_points = await task_manager.complete_task(task_id, result)
+        await WebSocketService.handle_tasks_complete(websocket, client_id, [{"task_id": task_id, "result": result}])
+
+    @staticmethod
+    async def handle_tasks_complete(websocket: WebSocket, client_id: str, items: list):
+        """处理批量任务完成事件: items 为 [{"task_id", "result"}], 处理完后只推送一次积分和分发"""
+        # 更新任务状态和用户积分, 数据库写回由完成管道批量执行
+        completed = 0
+        credited = 0
+        for item in items:
+            completion = await task_manager.complete_task(item["task_id"], item["result"], client_id)
+            if completion is None:
+                continue
+            await completion_pipeline.submit(completion)
+            completed += 1
+            credited += completion["reward"]
+        if not completed:
+            return
+        # 其他节点可能还缓存着这个用户(客户端之前连在那里), 同步积分变动, 客户端重连回去时不会读到旧值
+        cluster.points_changed(client_id, credited)
+        new_points = user_cache.points(client_id)
         
         # 广播更新
-        await websocket.send_text(json.dumps({
+        task_manager.send_to_client(client_id, {
             "event": "points_update",
             "data": {"points": new_points}
-        }))
+        })
 
-        await websocket.send_text(json.dumps({
-            "event": "task_count",
-            "data": {"total_tasks": await task_manager.get_pending_tasks_count()}
-        }))
+        broadcaster.publish_task_count()
         
-        # 尝试分配新任务
-        await connection_manager.try_assign_task(client_id)
+        # 通知分发器分配新任务
+        dispatcher.worker_idle(client_id)
 
     @staticmethod
     async def check_timeout_tasks():
-        """检查并处理超时任务"""
+        """检查并处理超时任务: 从租约到期堆中取出到期任务, 批量放回待处理状态"""
         while True:
-            await asyncio.sleep(60)
-            timeout_threshold = datetime.now() - timedelta(minutes=5)
-            
-            # 查找超时任务
-            timeout_tasks = await Task.filter(
-                status='in_progress',
-                started_at__lte=timeout_threshold
-            )
-            
-            for task in timeout_tasks:
-                task.status = 'pending'
-                task.client_id = None
-                task.started_at = None
-                await task.save()
+            await asyncio.sleep(TASK_REAPER_INTERVAL)
+            try:
+                expired = await task_manager.requeue_expired()
+                if not expired:
+                    continue
+
+                task_manager.counter.tasks_requeued(len(expired))
+                for lease in expired:
+                    if task_manager.is_idle(lease['client_id']):
+                        dispatcher.worker_idle(lease['client_id'])
+                groups = {lease['group'] for lease in expired}
+                dispatcher.tasks_available(groups)
+                cluster.tasks_available(groups=groups)
+                broadcaster.publish_task_count()
+            except Exception:
+                logger.exception("超时任务回收失败")
 
     @staticmethod
-    async def task_scheduler():
-        """任务调度器"""
+    async def reconcile_task_counts():
+        """定期用数据库统计校准任务数量计数器, 只在 scheduler 主节点执行, 结果同步给其他节点"""
         while True:
-            await asyncio.sleep(5)
-            await task_manager.try_assign_tasks() 
\ No newline at end of file
+            await asyncio.sleep(TASK_COUNT_RECONCILE_INTERVAL)
+            if not cluster.is_leader('scheduler'):
+                continue
+            try:
+                await task_manager.flush_leases()
+                await task_manager.counter.load(completion_pipeline.backlog)
+                cluster.publish_counts()
+            except Exception:
+                logger.exception("任务计数校准失败")
+
+    @staticmethod
+    async def reap_orphaned_tasks():
+        """回收失效节点遗留的任务, 只在 reaper 主节点执行
+
+        失效节点预取未分配的任务直接放回待处理; 它持有的执行中任务在超过到期时间后放回。
+        启动时先执行一次, 回收本机上次运行(进程号不同, 节点ID也不同)遗留的预取任务。
+        使用进程内总线时看不到其他进程的心跳, 只在启动时执行一次: 这时只允许一个进程使用数据库,
+        定期回收会把其他进程(误与本进程共用数据库)仍在内存中持有的任务放回, 导致同一任务被分配两次。
+        """
+        while True:
+            try:
+                if cluster.is_leader('reaper'):
+                    # 每次重新读取存活节点, 避免误回收刚启动的节点已预取的任务
+                    live_nodes = await cluster.prune_dead_nodes()
+                    released = await task_manager.release_orphaned_claims(live_nodes)
+                    requeued = await task_manager.requeue_orphaned_leases(CLUSTER_ORPHAN_GRACE, live_nodes)
+                    if released or requeued:
+                        task_manager.counter.tasks_requeued(requeued)
+                        dispatcher.tasks_available()
+                        cluster.tasks_available()
+                        broadcaster.publish_task_count()
+            except Exception:
+                logger.exception("失效节点任务回收失败")
+            if not cluster.bus.shared:
+                return
+            await asyncio.sleep(CLUSTER_REAPER_INTERVAL)
+
+# 客户端消息的处理函数: event -> handler(websocket, client_id, data)
+MESSAGE_HANDLERS = {
+    "task_complete": lambda websocket, client_id, data: WebSocketService.handle_task_complete(
+        websocket, client_id, data["task_id"], data["result"]
+    ),
+    "tasks_complete": WebSocketService.handle_tasks_complete,
+}
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from app.core.config import WORKER_STATS_ALPHA, WORKER_FAST_RATIO, WORKER_STATS_MAX_CLIENTS
+
+class WorkerStats:
+    """客户端执行情况的滚动统计, 全部为指数加权移动平均(EWMA), 近期的表现权重更大
+
+    - ratio: 实际用时 / 任务 duration, 大于 1 说明比预期慢
+    - seconds: 实际用时(秒); duration: 分到的任务的 duration
+    - success_rate / timeout_rate: 每次结果(完成、超时、无效提交)中成功和超时的比例
+    - fast_rate: 完成用时不到 duration * WORKER_FAST_RATIO 的比例, 过高说明客户端可能没有真正执行任务
+
+    客户端按顺序执行窗口内的任务, 一个任务的实际用时从它被分配和上一个任务完成两者中较晚的时刻算起。
+    统计只保存在内存中, 最多保留 WORKER_STATS_MAX_CLIENTS 个客户端, 超出时淘汰最久没有更新的。
+    """
+
+    def __init__(self, alpha: float = WORKER_STATS_ALPHA, max_clients: int = WORKER_STATS_MAX_CLIENTS):
+        self.alpha = alpha
+        self.max_clients = max_clients
+        self._stats: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+
+    def _get(self, client_id: str) -> Dict[str, Any]:
+        stats = self._stats.get(client_id)
+        if stats is None:
+            stats = self._stats[client_id] = {
+                "ratio": None, "seconds": None, "duration": None,
+                "success_rate": 1.0, "timeout_rate": 0.0, "fast_rate": 0.0,
+                "completed": 0, "timeouts": 0, "rejected": 0, "last_done": 0.0
+            }
+            if len(self._stats) > self.max_clients:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(client_id)
+        return stats
+
+    def _update(self, stats: Dict[str, Any], key: str, value: float):
+        old = stats[key]
+        stats[key] = value if old is None else old + self.alpha * (value - old)
+
+    def _outcome(self, stats: Dict[str, Any], success: bool, timeout: bool):
+        self._update(stats, "success_rate", 1.0 if success else 0.0)
+        self._update(stats, "timeout_rate", 1.0 if timeout else 0.0)
+
+    def task_assigned(self, client_id: str, duration: int):
+        self._update(self._get(client_id), "duration", duration)
+
+    def task_completed(self, client_id: str, lease: Dict[str, Any], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        stats = self._get(client_id)
+        stats["completed"] += 1
+        self._outcome(stats, True, False)
+        # 启动时从数据库载入的租约没有分配时间, 不计入用时
+        if 'assigned_at' in lease:
+            elapsed = max(now - max(lease['assigned_at'], stats["last_done"]), 0.0)
+            ratio = elapsed / lease['duration'] if lease['duration'] > 0 else 1.0
+            self._update(stats, "seconds", elapsed)
+            self._update(stats, "ratio", ratio)
+            self._update(stats, "fast_rate", 1.0 if ratio < WORKER_FAST_RATIO else 0.0)
+        stats["last_done"] = now
+
+    def task_timed_out(self, client_id: str):
+        stats = self._get(client_id)
+        stats["timeouts"] += 1
+        self._outcome(stats, False, True)
+
+    def task_rejected(self, client_id: str):
+        """提交了没有有效租约的任务(重复提交、已超时回收或不属于自己)"""
+        stats = self._get(client_id)
+        stats["rejected"] += 1
+        self._outcome(stats, False, False)
+
+    def expected_completion(self, client_id: str, outstanding: float) -> float:
+        """客户端再接一个任务, 预计多久能成功完成(秒)
+
+        outstanding 为它手上任务的 duration 之和; 按历史速度折算, 再除以成功率(失败后需要重新执行)。
+        没有记录的客户端按预期速度计算。
+        """
+        stats = self._stats.get(client_id)
+        if stats is None:
+            return outstanding
+        ratio = stats["ratio"] if stats["ratio"] is not None else 1.0
+        return ratio * (outstanding + (stats["duration"] or 0)) / max(stats["success_rate"], 0.05)
+
+    def get(self, client_id: str) -> Optional[Dict[str, Any]]:
+        stats = self._stats.get(client_id)
+        if stats is None:
+            return None
+        return {key: value for key, value in stats.items() if key != "last_done"}
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [dict(self.get(client_id), client_id=client_id) for client_id in self._stats]
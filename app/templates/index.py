@@ -79,6 +79,8 @@ def get_html_template():
             <script>
                 let ws = null;
                 let currentTask = null;
+                let taskQueue = [];  // 已租给本客户端、尚未开始的任务
+                const PREFETCH = 2;  // 同时持有的任务数, 完成一个后立即开始下一个
                 let clientId = localStorage.getItem('client_id');
 
                 (function init() {
@@ -164,39 +166,66 @@ def get_html_template():
 		    const wsProtocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
 
 		    // 创建WebSocket连接
-                    ws = new WebSocket(`${wsProtocol}${location.host}/ws/${clientId}`);
+                    ws = new WebSocket(`${wsProtocol}${location.host}/ws/${clientId}?prefetch=${PREFETCH}&batch=1`);
                     
                     ws.onmessage = (event) => {
                         const msg = JSON.parse(event.data);
-                        switch(msg.event) {
-                            case 'init':
-                                document.getElementById('online-count').textContent = msg.data.online_clients;
-                                document.getElementById('task-count').textContent = msg.data.total_tasks;
-                                document.getElementById('points').textContent = msg.data.points;
-                                document.getElementById('user-name').textContent = msg.data.username || '-';
-                                break;
-                            case 'online_count':
-                                document.getElementById('online-count').textContent = msg.data;
-                                break;
-                            case 'task_count':
-                                document.getElementById('task-count').textContent = msg.data.total_tasks;
-                                break;
-                            case 'new_task':
-                                showTask(msg.data);
-                                currentTask = msg.data;
-                                startAutoComplete(msg.data.duration);
-                                break;
-                            case 'points_update':
-                                document.getElementById('points').textContent = msg.data.points;
-                                break;
-                            case 'waiting':
-                                document.getElementById('current-task').innerHTML = 
-                                    '<div class="task">Waiting for new tasks...</div>';
-                                break;
+                        // 同一次操作产生的多条消息合并在 batch 中
+                        if (msg.event === 'batch') {
+                            msg.data.forEach(handleMessage);
+                        } else {
+                            handleMessage(msg);
                         }
                     };
                 }
 
+                function handleMessage(msg) {
+                    switch(msg.event) {
+                        case 'init':
+                            document.getElementById('online-count').textContent = msg.data.online_clients;
+                            document.getElementById('task-count').textContent = msg.data.total_tasks;
+                            document.getElementById('points').textContent = msg.data.points;
+                            document.getElementById('user-name').textContent = msg.data.username || '-';
+                            break;
+                        case 'online_count':
+                            document.getElementById('online-count').textContent = msg.data;
+                            break;
+                        case 'task_count':
+                            document.getElementById('task-count').textContent = msg.data.total_tasks;
+                            break;
+                        case 'new_task':
+                            enqueueTasks([msg.data]);
+                            break;
+                        case 'new_tasks':
+                            enqueueTasks(msg.data);
+                            break;
+                        case 'points_update':
+                            document.getElementById('points').textContent = msg.data.points;
+                            break;
+                        case 'waiting':
+                            if (!currentTask) {
+                                document.getElementById('current-task').innerHTML = 
+                                    '<div class="task">Waiting for new tasks...</div>';
+                            }
+                            break;
+                    }
+                }
+
+                function enqueueTasks(tasks) {
+                    taskQueue.push(...tasks);
+                    if (!currentTask) {
+                        runNextTask();
+                    }
+                }
+
+                function runNextTask() {
+                    currentTask = taskQueue.shift() || null;
+                    if (currentTask) {
+                        showTask(currentTask);
+                        startAutoComplete(currentTask.duration);
+                    }
+                }
+
                 function showTask(task) {
                     document.getElementById('current-task').innerHTML = `
                         <div class="task">
@@ -220,9 +249,10 @@ def get_html_template():
                         if (width >= 100) {
                             clearInterval(interval);
                             ws.send(JSON.stringify({
-                                event: "task_complete",
-                                data: { task_id: currentTask.id, result: currentTask.data }
+                                event: "tasks_complete",
+                                data: [{ task_id: currentTask.id, result: currentTask.data }]
                             }));
+                            runNextTask();
                         }
                     }, 100);
                 }
@@ -0,0 +1,149 @@
+"""热点查询在有无索引时的耗时对比
+
+用法: python -m benchmarks.bench_indexes [--rows 1000000]
+
+在临时 SQLite 数据库中生成任务/结果/用户数据, 分别在未建索引和执行
+apply_migrations() 之后运行预取认领、计数、回收查询, 以及 /rank 和 /results 的首页和
+深页游标分页查询, 输出中位耗时。查询条件和排序与服务中的实际查询一致。
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+from tortoise import Tortoise, timezone
+from tortoise.functions import Count
+
+from app.core.config import DB_CONFIG, TASK_PREFETCH_BATCH_SIZE
+from app.core.database import INDEXES, OBSOLETE_INDEXES, apply_migrations
+from app.core.pagination import keyset_after
+from app.models.models import Task, User, Result
+
+BATCH = 10000
+QUEUES = ['default', 'default', 'default', 'campaign']
+REQUIREMENTS = ['', '', 'gpu']
+# 生成数据的起始时间, 写入和查询使用同一个带时区的时间
+START = timezone.now()
+
+async def populate(rows: int):
+    conn = Tortoise.get_connection('default')
+    now = START
+    statuses = ['completed'] * 8 + ['pending', 'in_progress']
+    task_ids = []
+    for start in range(0, rows, BATCH):
+        batch = []
+        for i in range(start, min(start + BATCH, rows)):
+            task_id = str(uuid.uuid4())
+            status = random.choice(statuses)
+            created_at = now - timedelta(seconds=rows - i)
+            started_at = created_at + timedelta(seconds=1) if status != 'pending' else None
+            batch.append([
+                task_id, f"Task-{i}", random.randint(1, 3), random.randint(10, 100), status,
+                None if status == 'pending' else f"client-{i % 1000}",
+                '{}', started_at and started_at.isoformat(" "), created_at.isoformat(" "),
+                random.randint(0, 2), random.choice(QUEUES), random.choice(REQUIREMENTS)
+            ])
+            task_ids.append((task_id, created_at))
+        await conn.execute_many(
+            "INSERT INTO task (id, name, duration, reward, status, client_id, data, started_at, created_at, "
+            "priority, queue, requirements) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            batch
+        )
+
+    for start in range(0, len(task_ids), BATCH):
+        await conn.execute_many(
+            "INSERT INTO result (task_id, result_data, created_at) VALUES (?, ?, ?)",
+            [
+                [task_id, '{"data": {}}', (created_at + timedelta(seconds=2)).isoformat(" ")]
+                for task_id, created_at in task_ids[start:start + BATCH]
+            ]
+        )
+
+    users = max(rows // 100, 1)
+    for start in range(0, users, BATCH):
+        await conn.execute_many(
+            'INSERT INTO "user" (id, username, points, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+            [
+                [str(uuid.uuid4()), f"user{i}", random.randint(0, 100000), now.isoformat(" "), now.isoformat(" ")]
+                for i in range(start, min(start + BATCH, users))
+            ]
+        )
+
+def queries(rows: int):
+    middle = START - timedelta(seconds=rows // 2)
+    # 深页游标: 结果按插入顺序自增, 第 rows // 2 条的 created_at 为 middle + 2 秒
+    result_cursor = (middle + timedelta(seconds=2), rows // 2)
+    rank_cursor = (50000, "user0")
+    return {
+        # TaskManager._claim: 按 (queue, requirements) 分组, 优先级从高到低, 同优先级先进先出
+        "claim (pending, queue, requirements ORDER BY priority DESC, created_at)": lambda: Task.filter(
+            status='pending', queue='default', requirements=''
+        ).order_by('-priority', 'created_at').limit(TASK_PREFETCH_BATCH_SIZE).values(
+            'id', 'name', 'data', 'duration', 'reward', 'priority', 'queue'),
+        "count (GROUP BY status)": lambda: Task.annotate(count=Count('id')).group_by('status').values(
+            'status', 'count'),
+        "reaper (in_progress AND started_at <= ?)": lambda: Task.filter(
+            status='in_progress', started_at__lte=middle).count(),
+        "rank first page (ORDER BY points DESC, username)": lambda: User.all().order_by(
+            '-points', 'username').limit(11).values('username', 'points'),
+        "rank deep page (keyset points, username)": lambda: User.filter(
+            keyset_after('points', rank_cursor[0], 'username', rank_cursor[1], descending=True)
+        ).order_by('-points', 'username').limit(11).values('username', 'points'),
+        "results first page (ORDER BY created_at, id)": lambda: Result.all().order_by(
+            'created_at', 'id').limit(11).values('id', 'result_data', 'created_at'),
+        "results deep page (keyset created_at, id)": lambda: Result.filter(
+            keyset_after('created_at', result_cursor[0], 'id', result_cursor[1])
+        ).order_by('created_at', 'id').limit(11).values('id', 'result_data', 'created_at'),
+    }
+
+async def measure(rows: int, repeat: int):
+    timings = {}
+    for name, query in queries(rows).items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await query()
+            samples.append((time.perf_counter() - start) * 1000)
+        timings[name] = statistics.median(samples)
+    return timings
+
+async def main(rows: int, repeat: int):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'bench.sqlite3')
+    config = {**DB_CONFIG, "connections": {"default": {
+        **DB_CONFIG["connections"]["default"],
+        "credentials": {**DB_CONFIG["connections"]["default"]["credentials"], "file_path": path}
+    }}}
+    await Tortoise.init(config=config)
+    try:
+        await Tortoise.generate_schemas()
+        print(f"生成 {rows} 条任务和结果...")
+        await populate(rows)
+
+        conn = Tortoise.get_connection('default')
+        for name in [*INDEXES, *OBSOLETE_INDEXES]:
+            await conn.execute_script(f"DROP INDEX IF EXISTS {name}")
+        before = await measure(rows, repeat)
+        await apply_migrations()
+        await conn.execute_script("ANALYZE")
+        after = await measure(rows, repeat)
+
+        print(f"{'query':<72}{'no index (ms)':>15}{'indexed (ms)':>15}{'speedup':>10}")
+        for name in before:
+            print(f"{name:<72}{before[name]:>15.2f}{after[name]:>15.2f}{before[name] / max(after[name], 1e-6):>9.1f}x")
+    finally:
+        await Tortoise.close_connections()
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,86 @@
+"""标准库 json 与 orjson 的序列化耗时对比
+
+用法: python -m benchmarks.bench_json [--repeat 2000]
+
+使用服务端实际发送的几类消息(单个/批量新任务、初始化消息、带 result_data 的结果分页、
+导出的一块结果)分别测量 dumps 和 loads 的平均耗时; 未安装 orjson 时只输出标准库的结果。
+app.core.serialization 在安装了 orjson 时自动使用它。
+"""
+import argparse
+import json
+import random
+import string
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def random_text(length: int) -> str:
+    return ''.join(random.choices(string.ascii_letters + string.digits + '中文数据', k=length))
+
+def task_payload(i: int):
+    return {
+        "id": str(uuid.uuid4()),
+        "name": f"跳转任务-{i}",
+        "data": {"url": f"https://example.com/{random_text(20)}", "data_requirements": ["elements"]},
+        "duration": random.randint(1, 3),
+        "reward": random.randint(10, 100)
+    }
+
+def result_row(i: int):
+    return {
+        "id": i,
+        "task_id": str(uuid.uuid4()),
+        "task_name": f"跳转任务-{i}",
+        "created_at": datetime.now().isoformat(),
+        "result_data": {
+            "title": random_text(40),
+            "elements": [{"tag": "a", "href": random_text(30), "text": random_text(20)} for _ in range(20)]
+        }
+    }
+
+def messages():
+    return {
+        "new_task": {"event": "new_task", "data": task_payload(0)},
+        "new_tasks (16)": {"event": "new_tasks", "data": [task_payload(i) for i in range(16)]},
+        "init": {"event": "init", "data": {"online_clients": 120, "total_tasks": 50000, "points": 1234, "username": "user1"}},
+        "results page (10)": {"results": [result_row(i) for i in range(10)], "has_more": True},
+        "export chunk (1000)": [result_row(i) for i in range(1000)],
+    }
+
+def measure(func, arg, repeat: int) -> float:
+    """平均每次调用的耗时(微秒)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main(repeat: int):
+    backends = {"json": (lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':')), json.loads)}
+    if orjson:
+        backends["orjson"] = (lambda obj: orjson.dumps(obj).decode(), orjson.loads)
+    else:
+        print("未安装 orjson, 只测量标准库 json")
+
+    header = f"{'message':<22}{'bytes':>9}" + "".join(
+        f"{name + ' dumps':>16}{name + ' loads':>16}" for name in backends
+    )
+    print(header + "   (us/op)")
+    for name, message in messages().items():
+        # 大消息减少重复次数
+        count = max(repeat // (100 if name.startswith("export") else 1), 10)
+        text = backends["json"][0](message)
+        row = f"{name:<22}{len(text.encode()):>9}"
+        for dumps, loads in backends.values():
+            row += f"{measure(dumps, message, count):>16.1f}{measure(loads, text, count):>16.1f}"
+        print(row)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.repeat)
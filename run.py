@@ -1,4 +1,14 @@
+import os
+import sys
 import uvicorn
+from app.core.config import CLUSTER_BUS_URL, SERVER_WORKERS
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # 多个进程需要通过 Redis 共享客户端归属和选主状态, 且各自使用默认的 主机名-进程号 作为节点ID
+    if SERVER_WORKERS > 1 and not CLUSTER_BUS_URL:
+        sys.exit("WORKERS > 1 时需要设置 CLUSTER_BUS_URL")
+    if SERVER_WORKERS > 1 and os.environ.get("NODE_ID"):
+        sys.exit("WORKERS > 1 时不能设置 NODE_ID")
+    # 开发时设置 RELOAD=1 启用自动重载(只能单进程)
+    reload = os.environ.get("RELOAD") == "1"
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=reload, workers=SERVER_WORKERS)
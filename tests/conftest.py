@@ -0,0 +1,89 @@
+"""测试公共设施
+
+每个用到 db 的测试都在新的事件循环中使用一个独立的空数据库: 默认为临时 SQLite 文件;
+设置了 TEST_DATABASE_URL(如 postgres://postgres@127.0.0.1:5432/postgres)时, 同一组测试
+还会在该 PostgreSQL 上各建一个临时数据库再运行一遍, 结束后删除。
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tortoise import Tortoise
+from tortoise.backends.base.config_generator import expand_db_url
+from tortoise.backends.base.executor import EXECUTOR_CACHE
+
+from app.core.config import DB_CONFIG
+from app.core.database import apply_migrations
+from app.models.models import Task
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "")
+BACKENDS = ["sqlite"] + (["postgres"] if TEST_DATABASE_URL else [])
+
+def _connection(backend: str, tmp_path) -> dict:
+    if backend == "sqlite":
+        return {"engine": "tortoise.backends.sqlite", "credentials": {"file_path": str(tmp_path / "test.sqlite3")}}
+    parts = urlsplit(TEST_DATABASE_URL)
+    return expand_db_url(urlunsplit(parts._replace(path=f"/test_{uuid.uuid4().hex[:12]}")))
+
+@pytest.fixture(params=BACKENDS)
+def db(request, tmp_path):
+    """返回 run(test, schemas=True): 初始化空数据库后运行 await test(), 返回它的结果
+
+    schemas 为 False 时不建表, 由测试自己构造旧版本的表结构。
+    """
+    config = {**DB_CONFIG, "connections": {"default": _connection(request.param, tmp_path)}}
+
+    def run(test, schemas: bool = True):
+        # 预编译的 INSERT 语句按连接名缓存, 不区分数据库方言
+        EXECUTOR_CACHE.clear()
+
+        async def main():
+            await Tortoise.init(config=config, _create_db=request.param == "postgres")
+            try:
+                if schemas:
+                    await Tortoise.generate_schemas()
+                    await apply_migrations()
+                return await test()
+            finally:
+                if request.param == "postgres":
+                    await Tortoise._drop_databases()
+                else:
+                    await Tortoise.close_connections()
+        return asyncio.run(main())
+
+    run.backend = request.param
+    return run
+
+@pytest.fixture
+def local_timezone():
+    """把进程时区设为 UTC+8, 暴露把本地时间当作 UTC 的问题"""
+    original = os.environ.get("TZ")
+    os.environ["TZ"] = "Asia/Shanghai"
+    time.tzset()
+    yield
+    if original is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = original
+    time.tzset()
+
+async def _create_tasks(count: int, duration: int = 10, reward: int = 1, **fields) -> list:
+    ids = []
+    for i in range(count):
+        task = await Task.create(
+            id=str(uuid.uuid4()), name=f"Task-{i}", duration=duration, reward=reward, data={}, **fields
+        )
+        ids.append(task.id)
+    return ids
+
+@pytest.fixture
+def create_tasks():
+    """await create_tasks(count, **fields): 按创建顺序插入 count 个待处理任务, 返回任务ID"""
+    return _create_tasks
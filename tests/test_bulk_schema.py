@@ -0,0 +1,71 @@
+import random
+
+from pydantic import ValidationError
+
+from app.schemas.bulk import validate_tasks
+from app.schemas.schemas import TaskCreate
+
+MISSING = object()
+# 每个字段的候选值, 覆盖类型转换、边界和 TaskCreate 会拒绝的值; 无穷大来自 json 解析 Infinity
+NAMES = ["task", " padded ", "", "x" * 255, "x" * 256, "bad\x00", 5, 2.5, None, b"raw", [1], MISSING]
+INTS = [1, 7, 0, -1, "3", " 4 ", "2.5", 2.5, True, False, None, float("inf"), float("-inf"), float("nan"),
+        "1e400", "inf", [1], b"3", 10 ** 30, MISSING]
+DATA = [{}, {"url": "x"}, [("a", 1)], "x", None, [1, 2], 3, MISSING]
+PRIORITIES = [0, -5, "7", "x", None, 1.5, float("inf"), MISSING]
+QUEUES = ["default", "campaign", "", "x" * 50, "x" * 51, 3, None, MISSING]
+IDS = ["custom-1", "", None, 0, 5, 2.5, MISSING]
+FIELDS = [("name", NAMES), ("duration", INTS), ("reward", INTS), ("data", DATA), ("priority", PRIORITIES),
+          ("queue", QUEUES), ("id", IDS)]
+
+def expected(record: dict):
+    """TaskCreate 对同一记录的结果: (任务字典, 错误列表)"""
+    try:
+        return TaskCreate(**record).dict(), []
+    except ValidationError as e:
+        errors = []
+        for error in e.errors():
+            error = {"loc": list(error["loc"]), "msg": error["msg"], "type": error["type"], **(
+                {"ctx": error["ctx"]} if "ctx" in error else {}
+            )}
+            errors.append(error)
+        return None, errors
+    except OverflowError:
+        # pydantic 1.9 之前的 int_validator 不捕获 OverflowError, 之后的版本报告为无效整数
+        return None, None
+
+def test_validate_tasks_matches_task_create():
+    rng = random.Random(20261018)
+    records = []
+    for _ in range(3000):
+        record = {}
+        for field, values in FIELDS:
+            value = rng.choice(values)
+            if value is not MISSING:
+                record[field] = value
+        records.append(record)
+
+    tasks, errors = validate_tasks(records)
+    for row, record in enumerate(records):
+        task, task_errors = expected(record)
+        row_errors = [{key: value for key, value in error.items() if key != "row"}
+                      for error in errors if error["row"] == row]
+        if task_errors is None:
+            assert tasks[row] is None
+            assert any(error["type"] == "type_error.integer" for error in row_errors)
+            continue
+        assert row_errors == task_errors, record
+        if task is None:
+            assert tasks[row] is None
+            continue
+        # 缺失或为空的 id 各自生成, 不比较具体的值
+        if not record.get("id"):
+            task.pop("id")
+            assert len(tasks[row].pop("id")) == 36
+        assert tasks[row] == task, record
+
+def test_infinite_numbers_are_row_errors():
+    tasks, errors = validate_tasks([{"name": "a", "duration": float("inf"), "reward": float("-inf")}])
+    assert tasks == [None]
+    assert [(error["loc"], error["type"]) for error in errors] == [
+        (["duration"], "type_error.integer"), (["reward"], "type_error.integer")
+    ]
@@ -0,0 +1,22 @@
+import asyncio
+
+from app.models.models import Task
+from app.services import websocket_service
+from app.services.websocket_service import WebSocketService
+from tests.test_connection_manager import create_manager
+
+def test_local_bus_reaps_leftover_claims_only_at_startup(db, create_tasks, monkeypatch):
+    async def test():
+        ids = await create_tasks(1)
+        await Task.filter(id=ids[0]).update(status='queued', client_id='previous-run')
+        manager = create_manager()
+        await manager.cluster.start()
+        for name in ('task_manager', 'cluster', 'dispatcher', 'broadcaster'):
+            monkeypatch.setattr(websocket_service, name, getattr(manager, name))
+
+        # 进程内总线看不到其他进程: 启动时回收一次上次运行遗留的预取任务, 之后不再定期回收
+        await asyncio.wait_for(WebSocketService.reap_orphaned_tasks(), 5)
+        assert (await Task.get(id=ids[0])).status == 'pending'
+        await manager.cluster.close()
+
+    db(test)
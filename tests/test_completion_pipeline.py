@@ -0,0 +1,106 @@
+import asyncio
+
+from tortoise.exceptions import OperationalError
+
+from app.models.models import PointsLedger, Result, Task, User
+from app.services import completion_pipeline as pipeline_module
+from app.services.completion_pipeline import CompletionPipeline
+from app.services.ledger_manager import LedgerManager
+from app.services.task_manager import TaskManager
+
+def completion(task_id: str, result="ok", reward: int = 1) -> dict:
+    return {"task_id": task_id, "client_id": "c1", "reward": reward, "result": result}
+
+async def create_user():
+    await User.create(id="c1", username="alice")
+
+async def completed_ids() -> list:
+    return sorted(await Task.filter(status='completed').values_list('id', flat=True))
+
+async def drained(pipeline: CompletionPipeline):
+    while pipeline.backlog:
+        await asyncio.sleep(0.01)
+
+def test_submitted_completions_flush_in_one_batch(db, create_tasks):
+    async def test():
+        await create_user()
+        ids = await create_tasks(3, reward=2)
+        pipeline = CompletionPipeline(TaskManager(), LedgerManager())
+        pipeline.start()
+        for task_id in ids:
+            await pipeline.submit(completion(task_id, reward=2))
+        await asyncio.wait_for(drained(pipeline), 5)
+
+        assert await completed_ids() == sorted(ids)
+        assert await Result.all().count() == 3
+        assert await PointsLedger.filter(user_id="c1", reason='task_reward').count() == 3
+        assert (await User.get(id="c1")).points == 6
+        await pipeline.close()
+
+    db(test)
+
+def test_unwritable_completion_does_not_block_the_batch(db, create_tasks):
+    async def test():
+        await create_user()
+        ids = await create_tasks(4)
+        pipeline = CompletionPipeline(TaskManager(), LedgerManager())
+        pipeline.start()
+        # msgpack 之外的路径也可能带来无法序列化的结果; 这条记录被丢弃, 其余照常写回
+        await pipeline.submit(completion(ids[0]))
+        await pipeline.submit(completion(ids[1], result=b"raw"))
+        await pipeline.submit(completion(ids[2]))
+        await asyncio.wait_for(drained(pipeline), 5)
+
+        assert await completed_ids() == sorted([ids[0], ids[2]])
+        assert (await Task.get(id=ids[1])).status == 'pending'
+        assert (await User.get(id="c1")).points == 2
+
+        # 管道继续处理后面的完成记录
+        await pipeline.submit(completion(ids[3]))
+        await asyncio.wait_for(drained(pipeline), 5)
+        assert ids[3] in await completed_ids()
+        await pipeline.close()
+
+    db(test)
+
+def test_transient_failure_retries_the_whole_batch(db, create_tasks, monkeypatch):
+    async def test():
+        await create_user()
+        ids = await create_tasks(2)
+        pipeline = CompletionPipeline(TaskManager(), LedgerManager())
+        monkeypatch.setattr(pipeline_module, 'COMPLETION_RETRY_DELAY', 0)
+        flush = pipeline.flush
+        failures = []
+
+        async def flaky(batch):
+            if not failures:
+                failures.append(len(batch))
+                raise OperationalError("database is locked")
+            await flush(batch)
+        pipeline.flush = flaky
+
+        for task_id in ids:
+            await pipeline.submit(completion(task_id))
+        await pipeline.close()
+        assert failures == [2]
+        assert await completed_ids() == sorted(ids)
+        assert await PointsLedger.all().count() == 2
+
+    db(test)
+
+def test_close_drains_queued_completions(db, create_tasks):
+    async def test():
+        await create_user()
+        ids = await create_tasks(5)
+        pipeline = CompletionPipeline(TaskManager(), LedgerManager())
+        # 后台写回未运行时提交的记录在关闭时全部落库
+        for task_id in ids:
+            await pipeline.submit(completion(task_id))
+        assert pipeline.backlog == 5
+        await pipeline.close()
+
+        assert pipeline.backlog == 0
+        assert await completed_ids() == sorted(ids)
+        assert (await User.get(id="c1")).points == 5
+
+    db(test)
@@ -0,0 +1,172 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.bus import LocalBus
+from app.services import websocket_service
+from app.services.broadcaster import Broadcaster
+from app.services.cluster import Cluster
+from app.services.completion_pipeline import CompletionPipeline
+from app.services.connection_manager import ConnectionManager
+from app.services.dispatcher import Dispatcher
+from app.services.ledger_manager import LedgerManager
+from app.services.task_manager import TaskManager
+from app.services.user_cache import UserCache
+from app.services.websocket_service import WebSocketService
+
+USER = {"username": "alice", "points": 0, "created_at": None}
+
+class FakeWebSocket:
+    """记录发出的消息和关闭码, 代替 starlette 的 WebSocket"""
+
+    def __init__(self):
+        self.messages = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.messages.append(json.loads(text))
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+    def task_ids(self) -> list:
+        ids = []
+        for message in self.messages:
+            if message['event'] == 'new_task':
+                ids.append(message['data']['id'])
+            elif message['event'] == 'new_tasks':
+                ids.extend(task['id'] for task in message['data'])
+        return ids
+
+def create_manager(bus=None, node_id: str = 'test') -> ConnectionManager:
+    """按 app.core.instances 的方式组装一个节点; 传入同一个 bus 的节点组成集群"""
+    task_manager = TaskManager(UserCache())
+    dispatcher = Dispatcher(task_manager)
+    broadcaster = Broadcaster(task_manager)
+    cluster = Cluster(bus or LocalBus(), task_manager, dispatcher, broadcaster, node_id=node_id)
+    return ConnectionManager(task_manager, dispatcher, broadcaster, cluster)
+
+async def flush():
+    """让写协程和后台关闭任务运行完"""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+def test_replaced_connection_closes_without_unregistering_replacement():
+    async def test():
+        manager = create_manager()
+        task_manager = manager.task_manager
+        old_socket, new_socket = FakeWebSocket(), FakeWebSocket()
+        old = await manager.connect(old_socket, 'c1', dict(USER))
+        new = await manager.connect(new_socket, 'c1', dict(USER))
+        await flush()
+
+        assert old_socket.close_code == 4000
+        assert new_socket.close_code is None
+        assert task_manager.clients['c1'] is new
+
+        # 旧连接的接收循环随后结束, 不能清理已被新连接取代的客户端
+        manager.disconnect('c1', old)
+        assert task_manager.clients['c1'] is new
+        assert task_manager.is_idle('c1')
+        assert task_manager.user_cache.points('c1') == 0
+        assert new.send({"event": "waiting"})
+        await flush()
+        assert new_socket.messages[-1] == {"event": "waiting"}
+
+        manager.disconnect('c1', new)
+        assert 'c1' not in task_manager.clients
+        assert not task_manager.is_idle('c1')
+
+    asyncio.run(test())
+
+def test_reconnect_with_smaller_window_resends_leases(db, create_tasks):
+    async def test():
+        await create_tasks(3, duration=10)
+        manager = create_manager()
+        task_manager = manager.task_manager
+        old_socket = FakeWebSocket()
+        old = await manager.connect(old_socket, 'c1', dict(USER), window=3)
+        assert await task_manager.assign_tasks('c1') == 3
+        await flush()
+        leased = old_socket.task_ids()
+        deadlines = {task_id: task_manager.leases[task_id]['deadline'] for task_id in leased}
+        manager.disconnect('c1', old)
+
+        # 以窗口 1 重连: 仍持有的 3 个租约按开始顺序逐条重发, 到期时间不变
+        new_socket = FakeWebSocket()
+        await manager.connect(new_socket, 'c1', dict(USER), window=1)
+        await flush()
+        assert [message['event'] for message in new_socket.messages] == ['init'] + ['new_task'] * 3
+        assert new_socket.task_ids() == leased
+        assert {task_id: task_manager.leases[task_id]['deadline'] for task_id in leased} == deadlines
+
+        # 持有的租约超过新窗口, 完成到少于窗口之前不再分配
+        assert not task_manager.is_idle('c1')
+        assert await task_manager.assign_tasks('c1') == 0
+        for task_id in leased[:2]:
+            assert await task_manager.complete_task(task_id, 'ok', 'c1') is not None
+            assert not task_manager.is_idle('c1')
+        assert await task_manager.complete_task(leased[2], 'ok', 'c1') is not None
+        assert task_manager.is_idle('c1')
+
+    db(test)
+
+def test_completion_on_other_node_updates_cached_points(db, create_tasks, monkeypatch):
+    async def test():
+        await create_tasks(2, reward=5)
+        bus = LocalBus()
+        node_a, node_b = create_manager(bus, 'a'), create_manager(bus, 'b')
+        await node_a.cluster.start()
+        await node_b.cluster.start()
+
+        # 客户端先连在 A 上, 断开后 A 仍按 TTL 缓存它的用户信息
+        connection = await node_a.connect(FakeWebSocket(), 'c1', dict(USER))
+        node_a.disconnect('c1', connection)
+
+        # 转到 B 上完成任务, 积分由 B 上的完成处理计入
+        socket = FakeWebSocket()
+        await node_b.connect(socket, 'c1', dict(USER), window=2)
+        task_manager = node_b.task_manager
+        assert await task_manager.assign_tasks('c1') == 2
+        for name, value in {
+            'task_manager': task_manager, 'user_cache': task_manager.user_cache, 'cluster': node_b.cluster,
+            'dispatcher': node_b.dispatcher, 'broadcaster': node_b.broadcaster,
+            'completion_pipeline': CompletionPipeline(task_manager, LedgerManager()),
+        }.items():
+            monkeypatch.setattr(websocket_service, name, value)
+        await WebSocketService.handle_tasks_complete(socket, 'c1', [
+            {"task_id": task_id, "result": "ok"} for task_id in list(task_manager.leases)
+        ])
+        await flush()
+
+        # 重连回 A 时从缓存读到的积分包含在 B 上获得的奖励
+        assert task_manager.user_cache.points('c1') == 10
+        user = await node_a.task_manager.user_cache.get('c1')
+        assert user['points'] == 10
+
+        await node_a.cluster.close()
+        await node_b.cluster.close()
+
+    db(test)
+
+def test_failed_connect_unregisters_the_client():
+    async def test():
+        manager = create_manager()
+        task_manager = manager.task_manager
+
+        async def fail(client_id):
+            raise ConnectionError("database connection lost")
+        task_manager.resume_leases = fail
+        with pytest.raises(ConnectionError):
+            await manager.connect(FakeWebSocket(), 'c1', dict(USER))
+
+        # 失败的连接不能留在在线客户端和空闲索引中, 否则分发器会继续向它分配任务
+        assert 'c1' not in task_manager.clients
+        assert not task_manager.is_idle('c1')
+        assert task_manager.get_online_count() == 0
+
+    asyncio.run(test())
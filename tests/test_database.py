@@ -0,0 +1,59 @@
+from tortoise import Tortoise
+
+from app.core.database import INDEXES, OBSOLETE_INDEXES, apply_migrations, get_columns, is_postgres
+from app.models.models import Task
+
+# 加上 priority/queue/requirements 列之前的 task 表
+OLD_TASK_TABLE = """
+CREATE TABLE task (
+    id VARCHAR(36) NOT NULL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    duration INT NOT NULL,
+    reward INT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    client_id VARCHAR(36),
+    data {json},
+    started_at {timestamp},
+    completed_at {timestamp},
+    created_at {timestamp} NOT NULL
+)
+"""
+
+async def index_names(connection) -> set:
+    if is_postgres(connection):
+        _, rows = await connection.execute_query("SELECT indexname AS name FROM pg_indexes")
+    else:
+        _, rows = await connection.execute_query("SELECT name FROM sqlite_master WHERE type = 'index'")
+    return {row['name'] for row in rows}
+
+def test_migrations_upgrade_old_schema(db):
+    async def test():
+        connection = Tortoise.get_connection('default')
+        postgres = is_postgres(connection)
+        await connection.execute_script(OLD_TASK_TABLE.format(
+            json="JSONB" if postgres else "JSON",
+            timestamp="TIMESTAMPTZ" if postgres else "TIMESTAMP"
+        ))
+        await connection.execute_script(
+            "INSERT INTO task (id, name, duration, reward, data, created_at) VALUES "
+            "('t1', 'a', 1, 1, '{\"data_requirements\": [\"ocr\", \"gpu\"]}', CURRENT_TIMESTAMP), "
+            "('t2', 'b', 1, 1, '{}', CURRENT_TIMESTAMP)"
+        )
+        await connection.execute_script('CREATE INDEX idx_task_status_queue_priority ON task (status)')
+        await Tortoise.generate_schemas(safe=True)
+
+        await apply_migrations()
+        # 可重复执行
+        await apply_migrations()
+
+        assert {'priority', 'queue', 'requirements', 'node_id'} <= await get_columns(connection, 'task')
+        names = await index_names(connection)
+        assert set(INDEXES) <= names
+        assert not set(OBSOLETE_INDEXES) & names
+        rows = await Task.all().order_by('id').values('id', 'priority', 'queue', 'requirements')
+        assert rows == [
+            {'id': 't1', 'priority': 0, 'queue': 'default', 'requirements': 'gpu,ocr'},
+            {'id': 't2', 'priority': 0, 'queue': 'default', 'requirements': ''},
+        ]
+
+    db(test, schemas=False)
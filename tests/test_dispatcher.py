@@ -0,0 +1,40 @@
+import asyncio
+
+from tortoise.exceptions import OperationalError
+
+from app.services import dispatcher as dispatcher_module
+from app.services.dispatcher import Dispatcher
+from app.services.task_manager import TaskManager
+from tests.test_task_manager import FakeConnection
+
+def test_dispatcher_survives_a_failed_dispatch(db, create_tasks, monkeypatch):
+    async def test():
+        monkeypatch.setattr(dispatcher_module, 'DISPATCH_RETRY_DELAY', 0)
+        await create_tasks(1)
+        manager = TaskManager()
+        connection = FakeConnection()
+        manager.add_client('c1', connection)
+        ensure_ready = manager.ensure_ready
+        failures = []
+
+        async def flaky():
+            if not failures:
+                failures.append(1)
+                raise OperationalError("database is locked")
+            await ensure_ready()
+        manager.ensure_ready = flaky
+
+        dispatcher = Dispatcher(manager)
+        runner = asyncio.create_task(dispatcher.run())
+        dispatcher.worker_idle('c1')
+        for _ in range(100):
+            if connection.task_ids():
+                break
+            await asyncio.sleep(0.01)
+        runner.cancel()
+
+        # 第一次分发失败后分发协程仍在运行, 重试时把任务分给了客户端
+        assert failures == [1]
+        assert len(connection.task_ids()) == 1
+
+    db(test)
@@ -0,0 +1,63 @@
+import asyncio
+
+from tortoise.transactions import in_transaction
+
+from app.models.models import PointsLedger, User, Withdrawal
+from app.services.ledger_manager import LedgerManager
+
+async def create_user(client_id: str, points: int = 0):
+    await User.create(id=client_id, username=client_id, points=points)
+
+async def points(client_id: str) -> int:
+    return (await User.get(id=client_id)).points
+
+def test_credit_merges_updates_and_appends_every_entry(db):
+    async def test():
+        await create_user("c1")
+        await create_user("c2", points=5)
+        async with in_transaction():
+            await LedgerManager().credit([
+                {"client_id": "c1", "delta": 3, "reason": "task_reward", "ref_id": "t1"},
+                {"client_id": "c1", "delta": 4, "reason": "task_reward", "ref_id": "t2"},
+                {"client_id": "c2", "delta": 2, "reason": "task_reward", "ref_id": "t3"},
+            ])
+
+        assert (await points("c1"), await points("c2")) == (7, 7)
+        rows = await PointsLedger.all().order_by('id').values_list('user_id', 'delta', 'ref_id')
+        assert rows == [("c1", 3, "t1"), ("c1", 4, "t2"), ("c2", 2, "t3")]
+
+    db(test)
+
+def test_withdraw_only_when_balance_covers_amount(db):
+    async def test():
+        await create_user("c1", points=10)
+        ledger = LedgerManager()
+
+        assert await ledger.withdraw("c1", 11) is None
+        assert await points("c1") == 10
+        assert await Withdrawal.all().count() == 0
+        assert await PointsLedger.all().count() == 0
+
+        withdrawal = await ledger.withdraw("c1", 10)
+        assert (withdrawal.amount, withdrawal.status) == (10, 'pending')
+        assert await points("c1") == 0
+        assert await PointsLedger.filter(user_id="c1").values_list('delta', 'reason', 'ref_id') == [
+            (-10, 'withdrawal', str(withdrawal.id))
+        ]
+        assert await ledger.withdraw("c1", 1) is None
+        assert await ledger.withdraw("missing", 1) is None
+
+    db(test)
+
+def test_concurrent_withdrawals_never_overdraw(db):
+    async def test():
+        await create_user("c1", points=10)
+        ledger = LedgerManager()
+        # 条件扣减 points >= amount 在数据库中判断, 并发的提现不会透支
+        results = await asyncio.gather(*(ledger.withdraw("c1", 3) for _ in range(5)))
+        succeeded = [withdrawal for withdrawal in results if withdrawal is not None]
+        assert len(succeeded) == 3
+        assert await points("c1") == 1
+        assert sum(await PointsLedger.filter(user_id="c1").values_list('delta', flat=True)) == -9
+
+    db(test)
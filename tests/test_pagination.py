@@ -0,0 +1,44 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.endpoints import get_rank_by_cursor, get_results_by_cursor
+from app.core.pagination import decode_cursor, encode_cursor
+
+def forged(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+def test_cursor_round_trips_typed_keys():
+    created_at = datetime(2026, 10, 18, 3, 4, 5, 123456, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_at, 42), datetime, int) == [created_at, 42]
+    assert decode_cursor(encode_cursor(7, "alice"), int, str) == [7, "alice"]
+
+@pytest.mark.parametrize("cursor, types", [
+    (forged([[1], [2]]), (int, str)),
+    (forged([1, 2]), (int, str)),
+    (forged(["1", "alice"]), (int, str)),
+    (forged([True, "alice"]), (int, str)),
+    (forged([1.5, "alice"]), (int, str)),
+    (forged([1, "alice", 3]), (int, str)),
+    (forged({"points": 1}), (int, str)),
+    (forged([{"dt": "yesterday"}, 1]), (datetime, int)),
+    (forged([{"dt": 5}, 1]), (datetime, int)),
+    (forged(["2026-10-18T00:00:00", 1]), (datetime, int)),
+    (forged([{"dt": "2026-10-18T00:00:00+00:00"}, "1"]), (datetime, int)),
+    ("not base64!", (int, str)),
+])
+def test_forged_cursors_are_rejected(cursor, types):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, *types)
+
+def test_cursor_endpoints_reject_forged_cursors_with_400(db):
+    async def test():
+        for endpoint in (get_rank_by_cursor, get_results_by_cursor):
+            with pytest.raises(HTTPException) as error:
+                await endpoint(forged([[1], [2]]), 10)
+            assert error.value.status_code == 400
+
+    db(test)
@@ -0,0 +1,61 @@
+import json
+import uuid
+
+import msgpack
+import pytest
+
+from app.core.protocol import EVENT_CODES, JsonProtocol, MsgpackProtocol
+
+TASKS = [
+    {"id": str(uuid.uuid4()), "name": "a", "data": {"url": "x"}, "duration": 5, "reward": 1},
+    {"id": "imported-7", "name": "b", "data": {}, "duration": 10, "reward": 2},
+]
+
+def client_frame(event: str, data) -> bytes:
+    """按客户端的方式编码 msgpack 帧: 标准格式的任务ID以 16 字节传输"""
+    return msgpack.packb([EVENT_CODES[event], data])
+
+def packed_id(task_id: str):
+    try:
+        return uuid.UUID(task_id).bytes
+    except ValueError:
+        return task_id
+
+def unpack_task(item: list) -> dict:
+    task_id = str(uuid.UUID(bytes=item[0])) if isinstance(item[0], bytes) else item[0]
+    return dict(zip(["id", "name", "data", "duration", "reward"], [task_id, *item[1:]]))
+
+def test_msgpack_round_trips_assignments_and_completions():
+    protocol = MsgpackProtocol()
+
+    code, data = msgpack.unpackb(protocol.encode({"event": "new_task", "data": TASKS[0]}))
+    assert code == EVENT_CODES["new_task"]
+    assert len(data[0]) == 16
+    assert unpack_task(data) == TASKS[0]
+
+    code, data = msgpack.unpackb(protocol.encode({"event": "new_tasks", "data": TASKS}))
+    assert code == EVENT_CODES["new_tasks"]
+    assert [unpack_task(item) for item in data] == TASKS
+
+    frame = client_frame("tasks_complete", [[packed_id(task["id"]), {"ok": [1, 2.5, None]}] for task in TASKS])
+    assert protocol.decode(frame) == {
+        "event": "tasks_complete",
+        "data": [{"task_id": task["id"], "result": {"ok": [1, 2.5, None]}} for task in TASKS],
+    }
+    frame = client_frame("task_complete", [packed_id(TASKS[0]["id"]), "done"])
+    assert protocol.decode(frame) == {"event": "task_complete", "data": {"task_id": TASKS[0]["id"], "result": "done"}}
+
+def test_json_round_trips_assignments_and_completions():
+    protocol = JsonProtocol()
+    assert json.loads(protocol.encode({"event": "new_tasks", "data": TASKS})) == {"event": "new_tasks", "data": TASKS}
+    completions = [{"task_id": task["id"], "result": "ok"} for task in TASKS]
+    frame = json.dumps({"event": "tasks_complete", "data": completions})
+    assert protocol.decode(frame) == {"event": "tasks_complete", "data": completions}
+
+@pytest.mark.parametrize("result", [b"raw", {"nested": [b"raw"]}, {1: "int key"}, msgpack.ExtType(1, b"x")])
+def test_msgpack_rejects_values_json_cannot_store(result):
+    protocol = MsgpackProtocol()
+    with pytest.raises(ValueError):
+        protocol.decode(client_frame("task_complete", [packed_id(TASKS[0]["id"]), result]))
+    with pytest.raises(ValueError):
+        protocol.decode(client_frame("tasks_complete", [[TASKS[1]["id"], result]]))
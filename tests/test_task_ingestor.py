@@ -0,0 +1,68 @@
+import json
+
+from app.models.models import Task
+from app.services import task_ingestor
+from app.services.task_ingestor import TaskIngestor
+
+def ndjson_stream(records, piece: int = 7):
+    """把记录编码为 NDJSON, 按 piece 字节切开, 模拟分段到达的请求体"""
+    body = "".join(json.dumps(record) + "\n" for record in records).encode()
+
+    async def stream():
+        for i in range(0, len(body), piece):
+            yield body[i:i + piece]
+    return stream()
+
+def task(task_id: str) -> dict:
+    return {"id": task_id, "name": task_id, "data": {}, "duration": 5, "reward": 1}
+
+def test_ingest_counts_rows_actually_inserted(db, create_tasks):
+    async def test():
+        existing = await create_tasks(2)
+        records = [task("a"), task(existing[0]), task("b"), task("a"), {"name": "missing duration"}, task(existing[1])]
+        ingestor = TaskIngestor(chunk_size=4)
+        chunks = [chunk async for chunk in ingestor.iter_chunks(ndjson_stream(records))]
+
+        assert [(chunk["rows"], chunk["inserted"], chunk["duplicates"], chunk["invalid"]) for chunk in chunks] == [
+            (4, 2, 2, 0), (2, 0, 1, 1)
+        ]
+        summary = ingestor.summary
+        assert (summary["rows"], summary["inserted"], summary["duplicates"], summary["invalid"]) == (6, 2, 3, 1)
+        assert summary["errors"][0]["row"] == 4
+        assert await Task.all().count() == 4
+
+    db(test)
+
+def test_insert_skips_rows_written_concurrently(db, create_tasks):
+    async def test():
+        # 另一个导入在去重查询之后写入了同样的 id: 忽略冲突的 INSERT 跳过它们, 不计入插入数
+        existing = await create_tasks(2)
+        tasks = [dict(task(task_id), priority=0, queue="default") for task_id in [*existing, "c", "d", "e"]]
+        assert await TaskIngestor()._insert(tasks) == 3
+        assert await Task.all().count() == 5
+
+    db(test)
+
+def test_undecodable_and_oversized_lines_are_row_errors(db, monkeypatch):
+    async def test():
+        monkeypatch.setattr(task_ingestor, 'INGEST_MAX_LINE_BYTES', 80)
+        lines = [
+            json.dumps(task("a")).encode(),
+            b'{"name": "\xff\xfe", "duration": 5, "reward": 1}',
+            json.dumps(dict(task("b"), name="b" * 100)).encode(),
+            json.dumps(dict(task("c"), name="中文"), ensure_ascii=False).encode(),
+        ]
+        body = b"".join(line + b"\n" for line in lines)
+
+        async def stream():
+            for i in range(0, len(body), 7):
+                yield body[i:i + 7]
+        summary = await TaskIngestor().ingest(stream())
+
+        assert (summary["rows"], summary["inserted"], summary["invalid"]) == (4, 2, 2)
+        assert [(error["row"], error["msg"]) for error in summary["errors"]] == [
+            (1, "不是有效的 UTF-8 编码"), (2, "单行超过 80 字节")
+        ]
+        assert sorted(await Task.all().values_list('name', flat=True)) == ["a", "中文"]
+
+    db(test)
@@ -0,0 +1,267 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from tortoise import Tortoise, timezone
+from tortoise.exceptions import OperationalError
+
+from app.core.config import NODE_ID
+from app.models.models import Task
+from app.services.task_manager import TaskManager
+
+class FakeConnection:
+    """记录发给客户端的消息, 代替 ClientConnection"""
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message) -> bool:
+        self.messages.append(message)
+        return True
+
+    def task_ids(self) -> list:
+        ids = []
+        for message in self.messages:
+            if message['event'] == 'new_task':
+                ids.append(message['data']['id'])
+            elif message['event'] == 'new_tasks':
+                ids.extend(task['id'] for task in message['data'])
+        return ids
+
+def test_refill_claims_by_priority_then_creation(db, create_tasks):
+    async def test():
+        low = await create_tasks(3)
+        high = await create_tasks(2, priority=5)
+        manager = TaskManager()
+        assert await manager.refill_pending_queue() == 5
+        assert await Task.filter(status='queued').count() == 5
+        ready = manager.ready['']
+        assert [ready.pop()['id'] for _ in range(5)] == high + low
+
+    db(test)
+
+def test_concurrent_refills_claim_disjoint_tasks(db, create_tasks):
+    if db.backend != 'postgres':
+        pytest.skip("FOR UPDATE SKIP LOCKED 认领只在 PostgreSQL 上使用")
+
+    async def test():
+        ids = await create_tasks(40)
+        managers = [TaskManager() for _ in range(4)]
+        await asyncio.gather(*(manager.refill_pending_queue() for manager in managers))
+        claimed = []
+        for manager in managers:
+            ready = manager.ready.get('')
+            while ready:
+                claimed.append(ready.pop()['id'])
+        assert sorted(claimed) == sorted(ids)
+        assert await Task.filter(status='queued').count() == 40
+
+    db(test)
+
+def test_flushed_lease_keeps_deadline_across_recover(db, create_tasks, local_timezone):
+    async def test():
+        await create_tasks(1, duration=20)
+        manager = TaskManager()
+        manager.add_client('c1', FakeConnection())
+        assert await manager.assign_tasks('c1') == 1
+        lease = next(iter(manager.leases.values()))
+        await manager.flush_leases()
+
+        row = await Task.get(id=lease['task_id'])
+        assert (row.status, row.client_id, row.node_id) == ('in_progress', 'c1', NODE_ID)
+        assert row.started_at == lease['started_at']
+
+        restarted = TaskManager()
+        await restarted.recover()
+        assert restarted.leases[lease['task_id']]['deadline'] == pytest.approx(lease['deadline'], abs=1e-3)
+        assert restarted.busy_clients == {'c1': {lease['task_id']}}
+        # 持有者仍存活时不能被当作失效节点的租约回收
+        assert await TaskManager().requeue_orphaned_leases(0, [NODE_ID]) == 0
+
+    db(test)
+
+def test_notified_groups_refill_without_rescanning(db, create_tasks):
+    async def test():
+        connection = Tortoise.get_connection('default')
+        queries = []
+        execute_query = connection.execute_query
+
+        async def record(query, values=None):
+            queries.append(query)
+            return await execute_query(query, values)
+        connection.execute_query = record
+        rescans = lambda: sum('DISTINCT' in query for query in queries)
+
+        manager = TaskManager()
+        assert await manager.refill_pending_queue() == 0
+        assert rescans() == 1
+
+        await create_tasks(3, queue='campaign')
+        manager.notify_tasks_available([('campaign', '')])
+        assert await manager.refill_pending_queue() == 3
+        # 内存中没有任务、也没有新通知时不再查询分组(直到 TASK_RESCAN_INTERVAL 之后)
+        while manager.ready['']:
+            manager.ready[''].pop()
+        assert await manager.refill_pending_queue() == 0
+        assert rescans() == 1
+
+        # 分组未知的通知(如失效节点的任务被回收)才重新查询
+        await create_tasks(2)
+        manager.notify_tasks_available()
+        assert await manager.refill_pending_queue() == 2
+        assert rescans() == 2
+
+    db(test)
+
+def test_window_fills_and_refills_after_completion(db, create_tasks):
+    async def test():
+        await create_tasks(5, duration=10)
+        manager = TaskManager()
+        connection = FakeConnection()
+        manager.add_client('c1', connection, window=3)
+
+        assert await manager.assign_tasks('c1') == 3
+        assert [message['event'] for message in connection.messages] == ['new_tasks']
+        assert (manager.free_slots('c1'), manager.is_idle('c1')) == (0, False)
+        assert await manager.assign_tasks('c1') == 0
+        # 窗口内的任务依次执行, 后面任务的到期时间按前面任务的时长顺延
+        first, second, third = (manager.leases[task_id] for task_id in connection.task_ids())
+        assert second['deadline'] - first['deadline'] == pytest.approx(10, abs=1e-3)
+        assert third['deadline'] - second['deadline'] == pytest.approx(10, abs=1e-3)
+
+        assert await manager.complete_task(first['task_id'], 'ok', 'c1') is not None
+        assert (manager.free_slots('c1'), manager.is_idle('c1')) == (1, True)
+        assert await manager.assign_tasks('c1') == 1
+        assert len(connection.task_ids()) == 4
+        assert manager.busy_clients['c1'] == set(connection.task_ids()[1:])
+
+    db(test)
+
+def test_completion_rejected_for_non_owner_and_duplicate(db, create_tasks):
+    async def test():
+        await create_tasks(1)
+        manager = TaskManager()
+        manager.add_client('c1', FakeConnection())
+        manager.add_client('c2', FakeConnection())
+        assert await manager.assign_tasks('c1') == 1
+        task_id = next(iter(manager.leases))
+
+        assert await manager.complete_task(task_id, 'stolen', 'c2') is None
+        assert manager.leases[task_id]['client_id'] == 'c1'
+        assert manager.busy_clients == {'c1': {task_id}}
+
+        record = await manager.complete_task(task_id, 'ok', 'c1')
+        assert (record['client_id'], record['reward'], record['result']) == ('c1', 1, 'ok')
+        assert await manager.complete_task(task_id, 'ok', 'c1') is None
+        assert task_id not in manager.leases
+        assert (manager.stats.get('c1')['completed'], manager.stats.get('c1')['rejected']) == (1, 1)
+        assert manager.stats.get('c2')['rejected'] == 1
+
+    db(test)
+
+def test_expired_leases_free_slots_and_requeue(db, create_tasks):
+    async def test():
+        await create_tasks(2, duration=10)
+        manager = TaskManager()
+        manager.add_client('c1', FakeConnection(), window=2)
+        assert await manager.assign_tasks('c1') == 2
+        first, second = sorted(manager.leases.values(), key=lambda lease: lease['deadline'])
+
+        # 只有到期的租约被弹出, 客户端腾出一个位置
+        expired = manager.expire_leases(now=first['deadline'])
+        assert [lease['task_id'] for lease in expired] == [first['task_id']]
+        assert list(manager.leases) == [second['task_id']]
+        assert (manager.free_slots('c1'), manager.is_idle('c1')) == (1, True)
+        assert manager.stats.get('c1')['timeouts'] == 1
+
+        # 到期前尚未写回的租约不再写回
+        await manager.flush_leases()
+        assert (await Task.get(id=first['task_id'])).status == 'queued'
+        assert (await Task.get(id=second['task_id'])).status == 'in_progress'
+
+        assert await manager.requeue_tasks([first['task_id']]) == 1
+        row = await Task.get(id=first['task_id'])
+        assert (row.status, row.client_id, row.started_at) == ('pending', None, None)
+        # 超时后才提交的结果不再计入
+        assert await manager.complete_task(first['task_id'], 'late', 'c1') is None
+
+        # 按租约的分组通知后, 放回的任务重新分配
+        manager.notify_tasks_available({lease['group'] for lease in expired})
+        assert await manager.assign_tasks('c1') == 1
+        assert first['task_id'] in manager.leases
+
+    db(test)
+
+def test_failed_lease_flush_keeps_leases_for_retry(db, create_tasks):
+    async def test():
+        await create_tasks(2)
+        manager = TaskManager()
+        manager.add_client('c1', FakeConnection(), window=2)
+        assert await manager.assign_tasks('c1') == 2
+
+        connection = Tortoise.get_connection('default')
+        execute_many = connection.execute_many
+
+        async def fail(query, values):
+            raise OperationalError("database is locked")
+        connection.execute_many = fail
+        with pytest.raises(OperationalError):
+            await manager.flush_leases()
+        assert await Task.filter(status='queued').count() == 2
+
+        connection.execute_many = execute_many
+        await manager.flush_leases()
+        rows = await Task.all().values('status', 'client_id')
+        assert rows == [{'status': 'in_progress', 'client_id': 'c1'}] * 2
+
+    db(test)
+
+def test_failed_requeue_retries_expired_leases(db, create_tasks):
+    async def test():
+        await create_tasks(1)
+        manager = TaskManager()
+        manager.add_client('c1', FakeConnection())
+        assert await manager.assign_tasks('c1') == 1
+        await manager.flush_leases()
+        lease = next(iter(manager.leases.values()))
+
+        requeue_tasks = manager.requeue_tasks
+
+        async def fail(task_ids):
+            raise OperationalError("database is locked")
+        manager.requeue_tasks = fail
+        with pytest.raises(OperationalError):
+            await manager.requeue_expired(now=lease['deadline'])
+        assert lease['task_id'] not in manager.leases
+        assert (await Task.get(id=lease['task_id'])).status == 'in_progress'
+
+        # 租约已从到期堆中弹出, 下次调用仍会放回它的任务
+        manager.requeue_tasks = requeue_tasks
+        assert await manager.requeue_expired(now=lease['deadline']) == [lease]
+        assert (await Task.get(id=lease['task_id'])).status == 'pending'
+        assert await manager.requeue_expired(now=lease['deadline']) == []
+
+    db(test)
+
+def test_recover_adopts_only_leases_of_dead_nodes(db, create_tasks):
+    async def test():
+        live, dead, unowned = await create_tasks(3, duration=1)
+        started_at = timezone.now() - timedelta(hours=1)
+        await Task.filter(id=live).update(status='in_progress', client_id='c1', node_id='node-b', started_at=started_at)
+        await Task.filter(id=dead).update(status='in_progress', client_id='c2', node_id='node-x', started_at=started_at)
+        await Task.filter(id=unowned).update(status='in_progress', client_id='c3', started_at=started_at)
+
+        # node-b 仍存活: 它的客户端可能只是暂时断开, 租约留给它
+        manager = TaskManager()
+        await manager.recover(['node-b', NODE_ID])
+        assert set(manager.leases) == {dead, unowned}
+        owners = dict(await Task.filter(status='in_progress').values_list('id', 'node_id'))
+        assert owners == {live: 'node-b', dead: NODE_ID, unowned: NODE_ID}
+
+        # 存活节点的租约早已到期也不回收, 由持有它的节点处理
+        assert await manager.requeue_orphaned_leases(0, ['node-b', NODE_ID]) == 0
+        assert await manager.requeue_orphaned_leases(0, [NODE_ID]) == 1
+        row = await Task.get(id=live)
+        assert (row.status, row.node_id) == ('pending', None)
+
+    db(test)